@@ -0,0 +1,108 @@
+from dotenv import load_dotenv
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import JsonOutputParser
+from src.tools.llm_cache import get_llm_cache
+from src.agents.schemas import validate_fused, TriageResult
+from src.agents.triage_agent import SYSTEM_PROMPT as TRIAGE_PROMPT
+from src.agents.rag_agent import SYSTEM_PROMPT as LEGAL_PROMPT
+from src.tools.model_router import ModelRouter
+
+load_dotenv()
+
+# Bump when the prompt template changes: cached answers of the old template are then ignored
+PROMPT_VERSION = 1
+
+# نفس التعليمات ديال الوكلاء الثلاثة، ف طلب واحد كيرجع JSON واحد
+SYSTEM_PROMPT = f"""
+        أنت كتقوم بثلاث مهام ف جواب واحد.
+
+        المهمة 1 - التصنيف:
+        {TRIAGE_PROMPT}
+
+        المهمة 2 - الرأي القانوني (الحقل legal_advice):
+        {LEGAL_PROMPT}
+
+        المهمة 3 - التقرير (الحقل report، بالفرنسية، Markdown):
+        ### 📋 RAPPORT DÉCISIONNEL
+        **1. Résumé de la Situation :** (Une phrase claire)
+        **2. Analyse de Gravité :** (Urgence + Impact sur le citoyen)
+        **3. Base Légale Applicable :** (Citer les articles mentionnés dans l'avis juridique)
+        **4. Action Immédiate Recommandée :** (Ce que le président de la commune doit ordonner)
+        **5. Service Responsable :** (Identifier le service concerné : Travaux, Environnement, Urbanisme, etc.)
+
+        الرد كيكون JSON واحد فقط بهاد الحقول بهذا الترتيب:
+        category, summary_ar, urgency, original_language, legal_advice, report
+        """.replace("{", "{{").replace("}", "}}")
+
+class FusedAgent:
+    """
+    Triage, legal advice and report in a single LLM round trip.
+
+    Retrieval runs on the raw complaint (the category and summary are not known
+    before the call), through the RAG agent's speculative retriever and local
+    reranker. Meant for low-latency kiosks: one call instead of three, at the
+    price of a context that was not refined by the triage.
+    """
+
+    def __init__(self, rag_agent, router=None):
+        # JSON خاسر (ما دازش الـ schema) كيتعاود مع موديل أقوى
+        self.router = router if router is not None else ModelRouter()
+        self.llm_cache = get_llm_cache("fused", PROMPT_VERSION)
+        # الـ retrieval (المواد المذكورة، الفهرس، الـ reranker) ديال الـ RAGAgent المشارك
+        self.rag_agent = rag_agent
+
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("human", "السياق القانوني المستخرج:\n{context_text}\n\nالشكاية: {complaint}")
+        ])
+        self._chains = {}
+
+    def chain_for(self, model):
+        chain = self._chains.get(model)
+        if chain is None:
+            chain = self.prompt | self.router.llm("fused", model, temperature=0, cache=self.llm_cache) | JsonOutputParser()
+            self._chains[model] = chain
+        return chain
+
+    def retrieve(self, complaint_text):
+        cited = self.rag_agent.cited_articles(complaint_text)
+        if cited:
+            return cited
+        return self.rag_agent.rerank(complaint_text, self.rag_agent.prefetch(complaint_text))
+
+    async def aretrieve(self, complaint_text):
+        cited = self.rag_agent.cited_articles(complaint_text)
+        if cited:
+            return cited
+        return self.rag_agent.rerank(complaint_text, await self.rag_agent.aprefetch(complaint_text))
+
+    @staticmethod
+    def _split(result):
+        """Same shape as ComplaintsSystem's results ("metadata", "legal_basis"), plus "report"."""
+        result = validate_fused(result)
+        return {
+            "metadata": {field: result[field] for field in TriageResult.model_fields},
+            "legal_basis": result["legal_advice"],
+            "report": result["report"]
+        }
+
+    def process(self, complaint_text):
+        docs = self.retrieve(complaint_text)
+        return self.router.run("fused", self.chain_for, {
+            "context_text": self.rag_agent.format_context(docs, complaint_text),
+            "complaint": complaint_text
+        }, self._split)
+
+    async def aprocess(self, complaint_text):
+        docs = await self.aretrieve(complaint_text)
+        return await self.router.arun("fused", self.chain_for, {
+            "context_text": self.rag_agent.format_context(docs, complaint_text),
+            "complaint": complaint_text
+        }, self._split)
+
+# تجربة صغيرة
+if __name__ == "__main__":
+    from src import registry
+    result = registry.get_fused_agent().process("البولة طافية فالحومة هادي سيمانة")
+    print(result["metadata"])
+    print(result["report"])
@@ -1,43 +1,50 @@
 import os
-import re
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from src.tools.retriever import get_retriever
+from src.tools.retriever import (
+    get_retriever, first_stage, with_k, with_filter, reciprocal_rank_fusion,
+    multi_query_candidates, amulti_query_candidates, DEFAULT_K
+)
+from src.tools.arabic import tokenize
+from src.tools.reranker import LocalReranker
+from src.tools.sectors import category_sector, sector_filter, manifest_sector_counts
+from src.tools.llm_cache import get_llm_cache
+from src.tools.articles import ArticleIndex
+from src.tools.context_packs import ContextPacks, read_manifest
+from src.tools.context_builder import build_context
+from src.tools.model_router import ModelRouter
 
 # تحميل المتغيرات من .env
 load_dotenv()
 
-# Hardcoded base URL - no environment variable needed
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+# Bump when the prompt template changes: cached answers of the old template are then ignored
+PROMPT_VERSION = 1
 
-def clean_env_var(value):
-    """Remove all non-printable characters from a string."""
-    if not value:
-        return ""
-    return re.sub(r'[\x00-\x1f\x7f-\x9f]', '', value).strip()
+# Speculative retrieval on the raw complaint fetches wider, then gets narrowed
+# down once the triage category and summary are known.
+SPECULATIVE_K = 8
+# "rerank": re-order the speculative hits locally (no second round trip)
+# "fuse": run the category-aware retrieval too and merge both with RRF
+SPECULATIVE_REFINE = os.getenv("SPECULATIVE_REFINE", "rerank")
 
-class RAGAgent:
-    def __init__(self):
-        # إعداد الموديل عبر OpenRouter
-        self.llm = ChatOpenAI(
-            model="openai/gpt-4o-mini",
-            openai_api_key=clean_env_var(os.getenv("OPENROUTER_API_KEY")),
-            openai_api_base=OPENROUTER_BASE_URL
-        )
-        # جلب أداة البحث من الملف اللي صاوبنا
-        self.retriever = get_retriever()
-
-    def get_legal_advice(self, category, summary):
-        # 1. البحث عن النصوص القانونية المرتبطة بالشكاية
-        query = f"اختصاصات الجماعة في قطاع {category} و {summary}"
-        docs = self.retriever.invoke(query)
-        
-        # تجميع النصوص المستخرجة
-        context = "\n\n".join([d.page_content for d in docs])
+# البحث كيبدا ف القطع ديال القطاع ديال الشكاية (ماء -> sector_water...)، و كيرجع
+# للقاعدة كاملة غير إلا ما لقاش DEFAULT_K قطع فوق SECTOR_MIN_RELEVANCE. القطاعات اللي
+# عندها أقل من DEFAULT_K قطع ف الـ manifest ما كيتقلبوش بوحدهم (بحث واحد بلاصت جوج)
+SECTOR_ROUTING = os.getenv("SECTOR_ROUTING", "1") not in ("0", "false", "False")
+# Relevance as reported by Chroma (L2): 0.0 is a cosine similarity of about 0.29
+SECTOR_MIN_RELEVANCE = float(os.getenv("SECTOR_MIN_RELEVANCE", "0.0"))
 
-        # 2. إعداد الـ System Prompt
-        system_prompt = """
+# "single": سؤال واحد (القطاع + الملخص) ; "multi": عدة صيغ محلية (القطاع، الملخص،
+# الكلمات المفتاحية) كتبحث ف نفس الوقت و كتجمع بـ RRF
+QUERY_MODES = ("single", "multi")
+QUERY_MODE = os.getenv("RAG_QUERY_MODE", "single")
+MAX_KEYWORDS = 8
+
+# السياق المحسوب مسبقاً لكل قطاع (src/tools/context_packs.py)
+CONTEXT_PACKS_ENABLED = os.getenv("CONTEXT_PACKS", "1") not in ("0", "false", "False")
+
+# الـ System Prompt
+SYSTEM_PROMPT = """
         أنت مستشار قانوني خبير في القانون التنظيمي للجماعات بالمغرب (113.14).
         بناءً على النصوص القانونية المقدمة، حدد بوضوح:
         1. المادة القانونية التي تنظم هذا المجال.
@@ -47,26 +54,233 @@ class RAGAgent:
         استعمل لغة مهنية واضحة ومباشرة.
         """
 
-        # 3. بناء الـ Prompt باستخدام المتغيرات لتجنب أخطاء الـ Formatting
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
+class RAGAgent:
+    def __init__(self, retriever=None, speculative_retriever=None, article_index=None, context_packs=None,
+                 lexical_index=None, router=None, sector_counts=None):
+        # الموديل كيختارو الـ router (موديل أقوى للتحليل القانوني، ما دام ف حدود الـ latency و الثمن)
+        self.router = router if router is not None else ModelRouter()
+        self.llm_cache = get_llm_cache("rag", PROMPT_VERSION)
+        # جلب أداة البحث من الملف اللي صاوبنا (أو استعمال اللي مشارك ف الـ registry)
+        self.retriever = retriever if retriever is not None else get_retriever()
+        # Two stages: wide candidates, then the local reranker keeps the best
+        # DEFAULT_K (without a threshold if the retriever has no reranking)
+        self.candidates = first_stage(self.retriever)
+        self.reranker = getattr(self.retriever, "reranker", None) or LocalReranker(min_ratio=0.0)
+        if speculative_retriever is None:
+            # Same mode (vector / hybrid / lexical) as the main retriever, just wider
+            speculative_retriever = with_k(self.candidates, SPECULATIVE_K)
+        self.speculative_retriever = speculative_retriever
+        # المواد المذكورة بالرقم (المادة 83) كتجاوب مباشرة من الفهرس، بلا embedding
+        self.article_index = article_index if article_index is not None else ArticleIndex()
+        # sector code -> filtered copy of self.candidates, built on first use
+        self._sector_retrievers = {}
+        # Chunks per sector at ingestion: a partition too small to fill the context is not searched
+        if sector_counts is None:
+            sector_counts = manifest_sector_counts(read_manifest() or {})
+        self.sector_counts = sector_counts
+        self.context_packs = context_packs if context_packs is not None else ContextPacks()
+        # BM25 index used to check that a pack covers the complaint (hybrid/lexical retrievers carry one)
+        self.lexical_index = lexical_index if lexical_index is not None else getattr(self.retriever, "lexical_index", None)
+
+        # بناء الـ Prompt باستخدام المتغيرات لتجنب أخطاء الـ Formatting
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
             ("human", "السياق القانوني المستخرج:\n{context_text}\n\nنص الشكاية:\n{summary_text}")
         ])
 
-        # 4. إنشاء السلسلة (Chain) وتنفيذها
-        chain = prompt | self.llm
-        
+        # إنشاء السلسلة (Chain)، وحدة لكل موديل
+        self._chains = {}
+
+    def chain_for(self, model):
+        chain = self._chains.get(model)
+        if chain is None:
+            chain = self.prompt | self.router.llm("rag", model, cache=self.llm_cache)
+            self._chains[model] = chain
+        return chain
+
+    @property
+    def chain(self):
+        """Chain of the model currently selected (streaming uses it)."""
+        return self.chain_for(self.router.select("rag"))
+
+    @staticmethod
+    def build_query(category, summary):
+        return f"اختصاصات الجماعة في قطاع {category} و {summary}"
+
+    @staticmethod
+    def query_variants(category, summary):
+        """Query variants built locally (no LLM call): combined, category-only, summary-only, keywords."""
+        keywords = " ".join(list(dict.fromkeys(tokenize(f"{category} {summary}")))[:MAX_KEYWORDS])
+        variants = [
+            RAGAgent.build_query(category, summary),
+            f"اختصاصات الجماعة في قطاع {category}",
+            summary,
+            keywords,
+        ]
+        return [variant for variant in dict.fromkeys(v.strip() for v in variants) if variant]
+
+    @staticmethod
+    def format_context(docs, query=""):
+        # تجميع النصوص المستخرجة، بلا تكرار و ف حدود CONTEXT_TOKEN_BUDGET (الجمل الأقرب للشكاية)
+        text, _ = build_context(docs, query)
+        return text
+
+    def prefetch(self, complaint_text):
+        """Speculative retrieval on the raw complaint, started while triage runs."""
+        return self.speculative_retriever.invoke(complaint_text)
+
+    async def aprefetch(self, complaint_text):
+        return await self.speculative_retriever.ainvoke(complaint_text)
+
+    def cited_articles(self, summary):
+        return self.article_index.documents_for(summary, limit=DEFAULT_K)
+
+    def sector_retriever(self, category):
+        """
+        Retriever limited to the sector of `category`, or None (unknown sector,
+        routing off, or fewer than DEFAULT_K chunks of the sector in the corpus).
+        """
+        sector = category_sector(category) if SECTOR_ROUTING else None
+        if sector is None or self.sector_counts.get(sector, 0) < DEFAULT_K:
+            return None
+        retriever = self._sector_retrievers.get(sector)
+        if retriever is None:
+            retriever = with_filter(self.candidates, sector_filter(sector), SECTOR_MIN_RELEVANCE)
+            self._sector_retrievers[sector] = retriever
+        return retriever
+
+    @staticmethod
+    def prefer_sector(docs, category):
+        """Speculative hits of the complaint's sector, if there are enough of them."""
+        sector = category_sector(category) if SECTOR_ROUTING else None
+        if sector is None:
+            return docs
+        in_sector = [doc for doc in docs if doc.metadata.get(f"sector_{sector}")]
+        return in_sector if len(in_sector) >= DEFAULT_K else docs
+
+    def packed_context(self, category, query):
+        """
+        Context pack of the complaint's sector, re-ranked locally, or None.
+
+        The pack is only served when the complaint has BM25 hits and they are
+        all in it: a complaint that mentions something specific gets a real
+        search. Without a lexical index (or without any hit) nothing can be
+        checked, so nothing is served.
+        """
+        if not CONTEXT_PACKS_ENABLED or self.lexical_index is None:
+            return None
+        sector = category_sector(category)
+        pack = self.context_packs.get(sector)
+        if not pack:
+            return None
+        hits = self.lexical_index.search(query, k=DEFAULT_K)
+        if not hits:
+            return None
+        pack_ids = self.context_packs.chunk_ids(sector)
+        for doc, _ in hits:
+            if (doc.metadata.get("chunk_id") or doc.page_content) not in pack_ids:
+                return None
+        return self.rerank(query, pack)
+
+    def rerank(self, query, docs):
+        """Best DEFAULT_K candidates for `query`, scored locally (no network call)."""
+        return self.reranker.rerank(query, docs, DEFAULT_K)
+
+    def candidates_for(self, category, query, summary=None):
+        if QUERY_MODE == "multi" and summary is not None:
+            docs = multi_query_candidates(self.candidates, self.query_variants(category, summary))
+            return self.prefer_sector(docs, category)
+        partition = self.sector_retriever(category)
+        if partition is not None:
+            docs = partition.invoke(query)
+            if len(docs) >= DEFAULT_K:
+                return docs
+        return self.candidates.invoke(query)
+
+    async def acandidates_for(self, category, query, summary=None):
+        if QUERY_MODE == "multi" and summary is not None:
+            docs = await amulti_query_candidates(self.candidates, self.query_variants(category, summary))
+            return self.prefer_sector(docs, category)
+        partition = self.sector_retriever(category)
+        if partition is not None:
+            docs = await partition.ainvoke(query)
+            if len(docs) >= DEFAULT_K:
+                return docs
+        return await self.candidates.ainvoke(query)
+
+    def search(self, category, query, summary=None):
+        return self.rerank(query, self.candidates_for(category, query, summary))
+
+    async def asearch(self, category, query, summary=None):
+        return self.rerank(query, await self.acandidates_for(category, query, summary))
+
+    def retrieve(self, category, summary, prefetched_docs=None):
+        cited = self.cited_articles(summary)
+        if cited:
+            return cited
+        query = self.build_query(category, summary)
+        if prefetched_docs is None:
+            return self.packed_context(category, query) or self.search(category, query, summary)
+        if SPECULATIVE_REFINE == "fuse":
+            docs = self.candidates_for(category, query, summary)
+            return self.rerank(query, reciprocal_rank_fusion([docs, prefetched_docs], top_n=len(docs) + len(prefetched_docs)))
+        return self.rerank(query, self.prefer_sector(prefetched_docs, category))
+
+    async def aretrieve(self, category, summary, prefetched_docs=None):
+        cited = self.cited_articles(summary)
+        if cited:
+            return cited
+        query = self.build_query(category, summary)
+        if prefetched_docs is None:
+            return self.packed_context(category, query) or await self.asearch(category, query, summary)
+        if SPECULATIVE_REFINE == "fuse":
+            docs = await self.acandidates_for(category, query, summary)
+            return self.rerank(query, reciprocal_rank_fusion([docs, prefetched_docs], top_n=len(docs) + len(prefetched_docs)))
+        return self.rerank(query, self.prefer_sector(prefetched_docs, category))
+
+    def get_legal_advice(self, category, summary, prefetched_docs=None):
+        # 1. البحث عن النصوص القانونية المرتبطة بالشكاية
+        docs = self.retrieve(category, summary, prefetched_docs)
+
+        # 2. تنفيذ السلسلة
         # تمرير البيانات كـ Dictionary لضمان التعامل السليم مع الرموز
-        response = chain.invoke({
-            "context_text": context,
+        response = self.router.run("rag", self.chain_for, {
+            "context_text": self.format_context(docs, self.build_query(category, summary)),
             "summary_text": summary
         })
 
         return response.content
 
+    async def aget_legal_advice(self, category, summary, prefetched_docs=None):
+        docs = await self.aretrieve(category, summary, prefetched_docs)
+        response = await self.router.arun("rag", self.chain_for, {
+            "context_text": self.format_context(docs, self.build_query(category, summary)),
+            "summary_text": summary
+        })
+        return response.content
+
+    def stream_legal_advice(self, category, summary, prefetched_docs=None):
+        """Same as get_legal_advice, but yields the advice text chunk by chunk."""
+        docs = self.retrieve(category, summary, prefetched_docs)
+        for chunk in self.chain.stream({
+            "context_text": self.format_context(docs, self.build_query(category, summary)),
+            "summary_text": summary
+        }):
+            if chunk.content:
+                yield chunk.content
+
+    async def astream_legal_advice(self, category, summary, prefetched_docs=None):
+        docs = await self.aretrieve(category, summary, prefetched_docs)
+        async for chunk in self.chain.astream({
+            "context_text": self.format_context(docs, self.build_query(category, summary)),
+            "summary_text": summary
+        }):
+            if chunk.content:
+                yield chunk.content
+
 # كود تجريبي للتأكد من عمل الوكيل بشكل منفصل
 if __name__ == "__main__":
     rag = RAGAgent()
     print("--- تجربة وكيل البحث القانوني ---")
     advice = rag.get_legal_advice("إنارة", "البولة طافية فالحومة هادي سيمانة")
-    print(advice)
\ No newline at end of file
+    print(advice)
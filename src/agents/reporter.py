@@ -1,34 +1,62 @@
 import os
-import re
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from src.tools.llm_cache import get_llm_cache
+from src.tools.legal_opinion import legal_opinion
+from src.tools.sectors import category_sector
+from src.tools.model_router import ModelRouter
 
-# Hardcoded base URL - no environment variable needed
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+# Bump when the prompt template changes: cached answers of the old template are then ignored
+PROMPT_VERSION = 1
 
-def clean_env_var(value):
-    """Remove all non-printable characters from a string."""
-    if not value:
-        return ""
-    return re.sub(r'[\x00-\x1f\x7f-\x9f]', '', value).strip()
+# "template" : rapport rempli sans appel LLM à partir des champs du triage et de l'avis
+# "rich" : rapport rédigé par le LLM (REPORT_TEMPLATE ci-dessous)
+REPORT_MODES = ("template", "rich")
+REPORT_MODE = os.getenv("REPORT_MODE", "template")
 
-class ReportingAgent:
-    def __init__(self):
-        # تأكدي أن المفتاح كاين فـ .env
-        self.llm = ChatOpenAI(
-            model="openai/gpt-4o-mini", 
-            temperature=0,
-            openai_api_key=clean_env_var(os.getenv("OPENROUTER_API_KEY")),
-            openai_api_base=OPENROUTER_BASE_URL
-        )
-        self.parser = StrOutputParser()
+# Secteur de compétence (src/tools/sectors.py) -> libellé du secteur dans le rapport
+SECTOR_LABELS = {
+    "water": "eau et assainissement",
+    "lighting": "éclairage public",
+    "waste": "propreté et déchets",
+    "roads": "voirie et circulation",
+    "admin": "affaires administratives",
+}
+DEFAULT_SECTOR_LABEL = "autre (à qualifier par le service)"
 
-    def generate_report(self, analysis, legal_advice):
-        """
-        Consolide les résultats des autres agents en un rapport décisionnel.
-        """
-        template = """
+# Secteur de compétence -> service communal responsable
+SERVICES = {
+    "water": "Service de l'Assainissement et de l'Eau (en lien avec la Régie / le délégataire)",
+    "lighting": "Service de l'Éclairage Public",
+    "waste": "Service de l'Environnement et de la Propreté",
+    "roads": "Service des Travaux et de la Voirie",
+    "admin": "Service des Affaires Administratives et de l'État Civil",
+}
+DEFAULT_SERVICE = "Secrétariat Général de la Commune (orientation vers le service compétent)"
+
+# Action recommandée par secteur (l'action de l'avis juridique est en arabe)
+ACTIONS = {
+    "water": "Dépêcher une équipe d'intervention pour contrôler et réparer le réseau concerné.",
+    "lighting": "Ordonner le remplacement ou la réparation des points lumineux défaillants.",
+    "waste": "Programmer la collecte et le nettoyage du site signalé.",
+    "roads": "Ordonner la réfection de la chaussée et la sécurisation du site.",
+    "admin": "Transmettre la demande au service administratif pour traitement.",
+}
+DEFAULT_ACTION = "Instruire la plainte et saisir le service compétent."
+
+URGENCY = {
+    "High": ("Élevée", "risque direct pour la sécurité ou la santé des citoyens, intervention sous 24 h"),
+    "Medium": ("Moyenne", "gêne réelle pour les riverains, intervention sous 72 h"),
+    "Low": ("Faible", "à programmer dans le plan d'intervention ordinaire"),
+}
+
+COMPETENCES = {
+    "ذاتي": "compétence propre de la commune",
+    "مشترك": "compétence partagée entre la commune et l'État",
+    "منقول": "compétence transférée par l'État à la commune",
+}
+
+REPORT_TEMPLATE = """
         Tu es un Expert en Administration Publique Marocaine (Loi 113.14).
         Ta mission est de rédiger un rapport de décision basé sur l'analyse technique et l'avis juridique fournis.
 
@@ -47,11 +75,132 @@ class ReportingAgent:
         **5. Service Responsable :** (Identifier le service concerné : Travaux, Environnement, Urbanisme, etc.)
         """
 
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | self.llm | self.parser
-        
-        report = chain.invoke({
+def render_report(analysis, legal_advice):
+    """
+    Rapport décisionnel au format de REPORT_TEMPLATE, sans appel LLM.
+
+    Tout le texte vient des tables ci-dessus, en français : de l'avis juridique
+    (en arabe) on ne garde que les numéros d'articles et le type de compétence.
+    """
+    opinion = legal_opinion(legal_advice)
+    sector = category_sector(analysis.get("category", ""))
+    level, impact = URGENCY.get(analysis.get("urgency"), ("Non évaluée", "à apprécier par le service"))
+
+    articles = opinion["articles"]
+    if articles:
+        label = "article" if len(articles) == 1 else "articles"
+        legal_basis = f"Loi organique n° 113-14 relative aux communes, {label} {', '.join(str(a) for a in articles)}"
+    else:
+        legal_basis = "Loi organique n° 113-14 relative aux communes (article à confirmer par le service juridique)"
+    competence = COMPETENCES.get(opinion["competence"], "type de compétence à confirmer par le service juridique")
+    legal_basis += f" ({competence})"
+    action = ACTIONS.get(sector, DEFAULT_ACTION)
+    if opinion["action"]:
+        action += " Voir aussi la mesure proposée au point 3 de l'avis juridique."
+
+    # Lignes séparées par une ligne vide : un simple saut de ligne est fusionné par Markdown
+    return "\n\n".join([
+        "### 📋 RAPPORT DÉCISIONNEL",
+        f"**1. Résumé de la Situation :** Plainte citoyenne relevant du secteur « {SECTOR_LABELS.get(sector, DEFAULT_SECTOR_LABEL)} », "
+        f"urgence {level.lower()}.",
+        f"**2. Analyse de Gravité :** Urgence {level} : {impact}.",
+        f"**3. Base Légale Applicable :** {legal_basis}.",
+        f"**4. Action Immédiate Recommandée :** {action}",
+        f"**5. Service Responsable :** {SERVICES.get(sector, DEFAULT_SERVICE)}",
+    ])
+
+
+class ReportingAgent:
+    def __init__(self, mode=REPORT_MODE, router=None):
+        if mode not in REPORT_MODES:
+            raise ValueError(f"Unknown report mode {mode!r}, expected one of {REPORT_MODES}")
+        self.mode = mode
+        # Le modèle du mode "rich" est choisi par le routeur (src/tools/model_router.py)
+        self.router = router if router is not None else ModelRouter()
+        self.llm_cache = get_llm_cache("reporter", PROMPT_VERSION)
+        self.parser = StrOutputParser()
+        self.prompt = ChatPromptTemplate.from_template(REPORT_TEMPLATE)
+        self._chains = {}
+
+    def chain_for(self, model):
+        chain = self._chains.get(model)
+        if chain is None:
+            chain = self.prompt | self.router.llm("reporter", model, temperature=0, cache=self.llm_cache) | self.parser
+            self._chains[model] = chain
+        return chain
+
+    @property
+    def chain(self):
+        """Chaîne du modèle actuellement choisi par le routeur (utilisée en streaming)."""
+        return self.chain_for(self.router.select("reporter"))
+
+    def _use_template(self, analysis):
+        # Le gabarit a besoin des champs du triage
+        return self.mode == "template" and isinstance(analysis, dict)
+
+    def _render(self, analysis, legal_advice):
+        """Rapport du gabarit, ou None si c'est au LLM de le rédiger."""
+        if self._use_template(analysis):
+            return render_report(analysis, legal_advice)
+        return None
+
+    def generate_report(self, analysis, legal_advice):
+        """
+        Consolide les résultats des autres agents en un rapport décisionnel.
+        """
+        report = self._render(analysis, legal_advice)
+        if report is not None:
+            return report
+        report = self.router.run("reporter", self.chain_for, {
+            "analysis": analysis,
+            "legal_advice": legal_advice
+        })
+        return report
+
+    async def agenerate_report(self, analysis, legal_advice):
+        """
+        Version asynchrone de generate_report (même chaîne, via ainvoke).
+        """
+        report = self._render(analysis, legal_advice)
+        if report is not None:
+            return report
+        return await self.router.arun("reporter", self.chain_for, {
             "analysis": analysis,
             "legal_advice": legal_advice
         })
-        return report
\ No newline at end of file
+
+    def stream_report(self, analysis, legal_advice):
+        """
+        Génère le rapport morceau par morceau.
+
+        `legal_advice` peut être le texte complet ou un itérable de morceaux
+        encore en cours de streaming : il est consommé au fil de l'eau et la
+        requête part dès que le dernier morceau arrive (le prompt a besoin de
+        l'avis complet). En mode "template", le rapport arrive en un seul morceau.
+        """
+        if not isinstance(legal_advice, str):
+            legal_advice = "".join(legal_advice)
+        report = self._render(analysis, legal_advice)
+        if report is not None:
+            yield report
+            return
+        yield from self.chain.stream({
+            "analysis": analysis,
+            "legal_advice": legal_advice
+        })
+
+    async def astream_report(self, analysis, legal_advice):
+        """Version asynchrone de stream_report (accepte aussi un itérateur asynchrone)."""
+        if hasattr(legal_advice, "__aiter__"):
+            legal_advice = "".join([chunk async for chunk in legal_advice])
+        elif not isinstance(legal_advice, str):
+            legal_advice = "".join(legal_advice)
+        report = self._render(analysis, legal_advice)
+        if report is not None:
+            yield report
+            return
+        async for chunk in self.chain.astream({
+            "analysis": analysis,
+            "legal_advice": legal_advice
+        }):
+            yield chunk
@@ -0,0 +1,57 @@
+"""
+Output schemas shared by the agents.
+
+The triage JSON is validated with the same model whether it comes from
+TriageAgent, the local classifier or the single-call FusedAgent, so the rest
+of the pipeline (RAG, reporter, dashboard) can rely on its fields.
+"""
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, field_validator
+
+URGENCY_LEVELS = ("High", "Medium", "Low")
+
+
+class TriageResult(BaseModel):
+    # Extra keys ("source", "confidence" of the local classifier) are kept
+    model_config = ConfigDict(extra="allow", str_strip_whitespace=True)
+
+    category: str
+    summary_ar: str
+    urgency: Literal["High", "Medium", "Low"]
+    original_language: str = ""
+
+    @field_validator("urgency", mode="before")
+    @classmethod
+    def _capitalize_urgency(cls, value):
+        return value.strip().capitalize() if isinstance(value, str) else value
+
+    @field_validator("category", "summary_ar")
+    @classmethod
+    def _not_empty(cls, value):
+        if not value:
+            raise ValueError("must not be empty")
+        return value
+
+
+class FusedResult(TriageResult):
+    """Triage fields plus the legal opinion and the decision report, from one call."""
+
+    legal_advice: str
+    report: str
+
+    @field_validator("legal_advice", "report")
+    @classmethod
+    def _text_not_empty(cls, value):
+        if not value:
+            raise ValueError("must not be empty")
+        return value
+
+
+def validate_triage(data):
+    """Triage dict checked against TriageResult (raises pydantic.ValidationError, a ValueError)."""
+    return TriageResult.model_validate(data).model_dump()
+
+
+def validate_fused(data):
+    return FusedResult.model_validate(data).model_dump()
@@ -1,40 +1,44 @@
-import os
-import re
+import logging
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from src.tools.llm_cache import get_llm_cache
+from src.agents.schemas import validate_triage
+from src.tools.sectors import category_code
+from src.tools.model_router import ModelRouter, LowConfidence
+from src.tools.triage_classifier import TRIAGE_LOG_PATH, TRIAGE_LOG_ENABLED, append_triage_log
 
 load_dotenv()
 
-# Hardcoded base URL - no environment variable needed
-OPENROUTER_BASE_URL ="https://openrouter.ai/api/v1"
+logger = logging.getLogger(__name__)
 
-def clean_env_var(value):
-    """Remove all non-printable characters from a string."""
-    if not value:
-        return ""
-    return re.sub(r'[\x00-\x1f\x7f-\x9f]', '', value).strip()
+# Bump when the prompt template changes: cached answers of the old template are then ignored
+PROMPT_VERSION = 1
 
-class TriageAgent:
-    def __init__(self):
-        # إعداد الموديل عبر OpenRouter
-        # كنصحك بـ "anthropic/claude-3.5-sonnet" أو "openai/gpt-4o-mini" حيت واعرين ف الدارجة
-        self.llm = ChatOpenAI(
-            model="openai/gpt-4o-mini", 
-            openai_api_key=clean_env_var(os.getenv("OPENROUTER_API_KEY")),
-            openai_api_base=OPENROUTER_BASE_URL
-        )
+# category و summary_ar كيجيو الأولين باش الـ RAG يقدر يبدا قبل ما يكمل الـ JSON
+EARLY_FIELDS = ("category", "summary_ar")
 
-    def analyze_complaint(self, complaint_text):
-        system_prompt = """
+def fields_complete(partial, fields=EARLY_FIELDS):
+    """
+    True once every field in `fields` is final in a partially parsed JSON dict.
+
+    While streaming, the last key of the partial dict may still be growing; a
+    field is only final once the model has moved on to another key after it.
+    """
+    keys = list(partial)
+    for field in fields:
+        if field not in keys or keys.index(field) == len(keys) - 1:
+            return False
+    return True
+
+SYSTEM_PROMPT = """
         أنت وكيل ذكي متخصص في تصنيف شكايات المواطنين في المغرب.
         مهمتك هي قراءة الشكاية (التي قد تكون بالدارجة المغربية) وتحويلها إلى بيانات منظمة.
         
-        يجب أن يكون الرد بصيغة JSON فقط ويتضمن:
+        يجب أن يكون الرد بصيغة JSON فقط ويتضمن الحقول بهذا الترتيب بالضبط:
         - category: (ماء، إنارة، نفايات، طرق، إداري، أخرى)
-        - urgency: (High, Medium, Low)
         - summary_ar: ملخص للشكاية بالعربية الفصحى
+        - urgency: (High, Medium, Low)
         - original_language: لغة الشكاية الأصلية
         
         سياق الدارجة:
@@ -44,15 +48,203 @@ class TriageAgent:
         - "الحفرة، لكيود، الطريق" -> طرق
         """
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
+class TriageAgent:
+    def __init__(self, semantic_cache=None, classifier=None, log_path=TRIAGE_LOG_PATH if TRIAGE_LOG_ENABLED else None,
+                 router=None):
+        # الموديل كيختارو الـ router (src/tools/model_router.py) حسب السياسة و الـ latency و الثمن،
+        # و كيطلع لموديل أقوى إلا كان الـ JSON خاسر
+        self.router = router if router is not None else ModelRouter()
+        self.llm_cache = get_llm_cache("triage", PROMPT_VERSION)
+
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
             ("human", "الشكاية: {complaint}")
         ])
 
-        # ربط المكونات
-        chain = prompt | self.llm | JsonOutputParser()
-        
-        return chain.invoke({"complaint": complaint_text})
+        # سلسلة وحدة لكل موديل (كتبنى مرة وحدة، كتخدم للـ invoke و الـ ainvoke)
+        self._chains = {}
+
+        # شكايات شبيهة (نفس البولة، نفس الحفرة) كياخدو نفس التحليل بلا ما نعيطو للـ LLM
+        self.semantic_cache = semantic_cache
+
+        # الشكايات الواضحة كيصنفها الموديل المحلي (TriageClassifier) بلا LLM
+        self.classifier = classifier
+        # كل تحليل ديال الـ LLM كيتسجل باش نعاودو نتدربو عليه
+        self.log_path = log_path
+
+    def chain_for(self, model):
+        chain = self._chains.get(model)
+        if chain is None:
+            chain = self.prompt | self.router.llm("triage", model, cache=self.llm_cache) | JsonOutputParser()
+            self._chains[model] = chain
+        return chain
+
+    @property
+    def chain(self):
+        """Chain of the model currently selected (plain streaming, without escalation)."""
+        return self.chain_for(self.router.select("triage"))
+
+    @staticmethod
+    def _validated(result):
+        result = validate_triage(result)
+        # Category outside the prompt's list: worth asking a stronger model
+        if category_code(result["category"]) is None:
+            raise LowConfidence(f"unknown category {result['category']!r}", result)
+        return result
+
+    def _local_analysis(self, complaint_text):
+        """Analysis of the local classifier, or None when it is not confident enough."""
+        if self.classifier is None:
+            return None
+        try:
+            return self.classifier.analyze(complaint_text)
+        except Exception as e:
+            logger.warning("Local triage classifier failed, calling the LLM: %s", e)
+            return None
+
+    def _log(self, complaint_text, analysis):
+        if self.log_path is None or not all(analysis.get(field) for field in ("category", "urgency")):
+            return
+        try:
+            append_triage_log(complaint_text, analysis, self.log_path)
+        except OSError as e:
+            logger.warning("Could not log the triage: %s", e)
+
+    def _semantic_lookup(self, complaint_text):
+        """(cached analysis or None, complaint vector or None)."""
+        if self.semantic_cache is None:
+            return None, None
+        try:
+            vector = self.semantic_cache.embed(complaint_text)
+        except Exception as e:
+            logger.warning("Semantic cache unavailable, calling the LLM: %s", e)
+            return None, None
+        return self.semantic_cache.lookup(vector), vector
+
+    async def _asemantic_lookup(self, complaint_text):
+        if self.semantic_cache is None:
+            return None, None
+        try:
+            vector = await self.semantic_cache.aembed(complaint_text)
+        except Exception as e:
+            logger.warning("Semantic cache unavailable, calling the LLM: %s", e)
+            return None, None
+        return self.semantic_cache.lookup(vector), vector
+
+    def _semantic_store(self, vector, analysis):
+        # Only complete analyses are worth reusing
+        if vector is not None and all(analysis.get(field) for field in EARLY_FIELDS):
+            self.semantic_cache.add(vector, analysis)
+
+    def analyze_complaint(self, complaint_text):
+        local = self._local_analysis(complaint_text)
+        if local is not None:
+            return local
+        cached, vector = self._semantic_lookup(complaint_text)
+        if cached is not None:
+            return cached
+        result = self.router.run("triage", self.chain_for, {"complaint": complaint_text}, self._validated)
+        self._semantic_store(vector, result)
+        self._log(complaint_text, result)
+        return result
+
+    async def aanalyze_complaint(self, complaint_text):
+        local = self._local_analysis(complaint_text)
+        if local is not None:
+            return local
+        cached, vector = await self._asemantic_lookup(complaint_text)
+        if cached is not None:
+            return cached
+        result = await self.router.arun("triage", self.chain_for, {"complaint": complaint_text}, self._validated)
+        self._semantic_store(vector, result)
+        self._log(complaint_text, result)
+        return result
+
+    def stream_analysis(self, complaint_text, model=None):
+        """Yield the triage JSON as it is parsed, one growing partial dict at a time."""
+        chain = self.chain_for(model) if model else self.chain
+        yield from chain.stream({"complaint": complaint_text})
+
+    async def astream_analysis(self, complaint_text, model=None):
+        chain = self.chain_for(model) if model else self.chain
+        async for partial in chain.astream({"complaint": complaint_text}):
+            yield partial
+
+    def analyze_complaint_early(self, complaint_text, on_ready, fields=EARLY_FIELDS):
+        """
+        Stream the triage and call `on_ready(partial)` as soon as `fields` are
+        final, while the rest of the JSON is still being generated.
+
+        Returns the complete analysis, like analyze_complaint. `on_ready` is
+        called exactly once (at the end if the fields only complete there).
+        """
+        local = self._local_analysis(complaint_text)
+        if local is not None:
+            on_ready(dict(local))
+            return local
+        cached, vector = self._semantic_lookup(complaint_text)
+        if cached is not None:
+            on_ready(dict(cached))
+            return cached
+
+        model = self.router.select("triage")
+        result = {}
+        fired = False
+        try:
+            for partial in self.stream_analysis(complaint_text, model):
+                result = partial
+                if not fired and fields_complete(partial, fields):
+                    fired = True
+                    on_ready(dict(partial))
+            result = self._validated(result)
+            if not fired:
+                fired = True
+                on_ready(dict(result))
+        except ValueError as e:
+            # Same checks and escalation as analyze_complaint. If the fields
+            # were already final, the RAG agent started on the rejected answer.
+            result = self.router.escalate("triage", model, e, self.chain_for,
+                                                  {"complaint": complaint_text}, self._validated)
+            if not fired:
+                on_ready(dict(result))
+        self._semantic_store(vector, result)
+        self._log(complaint_text, result)
+        return result
+
+    async def aanalyze_complaint_early(self, complaint_text, on_ready, fields=EARLY_FIELDS):
+        """Async analyze_complaint_early; `on_ready` is a plain callback (e.g. one that creates a task)."""
+        local = self._local_analysis(complaint_text)
+        if local is not None:
+            on_ready(dict(local))
+            return local
+        cached, vector = await self._asemantic_lookup(complaint_text)
+        if cached is not None:
+            on_ready(dict(cached))
+            return cached
+
+        model = self.router.select("triage")
+        result = {}
+        fired = False
+        try:
+            async for partial in self.astream_analysis(complaint_text, model):
+                result = partial
+                if not fired and fields_complete(partial, fields):
+                    fired = True
+                    on_ready(dict(partial))
+            result = self._validated(result)
+            if not fired:
+                fired = True
+                on_ready(dict(result))
+        except ValueError as e:
+            # Same checks and escalation as analyze_complaint. If the fields
+            # were already final, the RAG agent started on the rejected answer.
+            result = await self.router.aescalate("triage", model, e, self.chain_for,
+                                                  {"complaint": complaint_text}, self._validated)
+            if not fired:
+                on_ready(dict(result))
+        self._semantic_store(vector, result)
+        self._log(complaint_text, result)
+        return result
 
 # تجربة صغيرة
 if __name__ == "__main__":
@@ -34,14 +34,16 @@ st.set_page_config(
 sys.path.append(os.getcwd())
 
 # Import Agents (Safe Import - store error for later display)
+# Agents are shared process-wide through the registry instead of rebuilt per click
 IMPORT_ERROR = None
-TriageAgent = None
-RAGAgent = None
-ReportingAgent = None
+registry = None
 try:
-    from src.agents.triage_agent import TriageAgent
-    from src.agents.rag_agent import RAGAgent
-    from src.agents.reporter import ReportingAgent
+    from src import registry
+    from src.tools.streaming import ChunkChannel, fan_out
+    from src.agents.triage_agent import TriageAgent  # noqa: F401 - surface import errors early
+    from src.agents.rag_agent import RAGAgent  # noqa: F401
+    from src.agents.reporter import ReportingAgent  # noqa: F401
+    from src.agents.fused_agent import FusedAgent  # noqa: F401
 except ImportError as e:
     IMPORT_ERROR = str(e)
 
@@ -215,6 +217,15 @@ def create_pdf(report_text):
         st.error(f"Erreur PDF: {e}")
         return None
 
+def render_advice_card(placeholder, legal_advice):
+    """(Re)draws the legal advice card, called on every streamed chunk."""
+    placeholder.markdown(f"""
+        <div class='glass-card' style='border-left: 4px solid #0040ff;'>
+            <h4 style='color: white;'>⚖️ Avis Juridique</h4>
+            <div style='color: #ccc; font-size: 0.9em;'>{legal_advice}</div>
+        </div>
+    """, unsafe_allow_html=True)
+
 # --- 5. State Management ---
 if 'logged_in' not in st.session_state:
     st.session_state['logged_in'] = False
@@ -263,6 +274,18 @@ def dashboard_view():
         if st.button("Déconnexion"):
             st.session_state['logged_in'] = False
             st.rerun()
+        if registry is not None and st.button("🔄 Recharger les agents"):
+            with st.spinner("Rechargement des agents..."):
+                registry.reload()
+            st.success("Agents rechargés.")
+        if registry is not None:
+            with st.expander("📊 Cache LLM"):
+                # Shared cache of the agents: no new SQLite connection per rerun
+                cache_stats = registry.get_llm_cache_stats()
+                if not cache_stats:
+                    st.caption("Aucune statistique pour le moment.")
+                for namespace, counters in cache_stats.items():
+                    st.caption(f"{namespace} — {counters['hits']} hits / {counters['misses']} misses ({counters['hit_rate']:.0%})")
 
     # Header
     st.markdown("""
@@ -276,6 +299,12 @@ def dashboard_view():
     st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
     st.markdown("<h3 style='color: white;'>📝 Nouvelle Plainte</h3>", unsafe_allow_html=True)
     user_input = st.text_area("Description du problème", height=120, placeholder="Ex: Panne d'éclairage public...", label_visibility="collapsed")
+    # "Rapide" : un seul appel LLM (triage + avis + rapport), pour les bornes à faible latence
+    fused = st.radio(
+        "Mode d'analyse",
+        ["Complet (3 agents)", "Rapide (1 appel)"],
+        horizontal=True
+    ) == "Rapide (1 appel)"
     process = st.button("🚀 Lancer l'Analyse")
     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -284,82 +313,131 @@ def dashboard_view():
         if IMPORT_ERROR:
             st.error(f"Erreur d'importation des agents : {IMPORT_ERROR}")
             return
-        if TriageAgent is None or RAGAgent is None or ReportingAgent is None:
+        if registry is None:
             st.error("Erreur : Les agents n'ont pas été chargés correctement.")
             return
             
-        with st.spinner("🔄 Analyse en cours par les agents IA..."):
-            try:
-                # 1. Triage Agent
-                triage_agent = TriageAgent()
-                analysis = triage_agent.analyze_complaint(user_input)
-                
+        try:
+            result = None
+            if fused:
+                with st.spinner("🔄 Analyse rapide en cours..."):
+                    try:
+                        result = registry.get_fused_agent().process(user_input)
+                    except ValueError:
+                        # Same fallback as ComplaintsSystem: the three agents take over
+                        st.warning("⚠️ Réponse rapide invalide : analyse complète par les 3 agents.")
+            if result is not None:
+                # Single call: the advice and the report arrive complete, as one "chunk" each
+                analysis = result["metadata"]
+                advice_for_ui = [result["legal_basis"]]
+                report_for_ui = [result["report"]]
+            else:
+                triage_agent = registry.get_triage_agent()
+                rag_agent = registry.get_rag_agent()
+                reporting_agent = registry.get_reporting_agent()
+                pool = registry.get_stage_pool()
+
+                # The legal advice is streamed once and copied to two readers:
+                # the advice card below and the reporting agent.
+                advice_for_ui = ChunkChannel()
+                advice_for_report = ChunkChannel()
+                report_for_ui = ChunkChannel()
+
+                def start_rag(partial):
+                    pool.submit(
+                        fan_out,
+                        rag_agent.stream_legal_advice(partial.get('category', 'Général'), partial.get('summary_ar', '')),
+                        advice_for_ui,
+                        advice_for_report
+                    )
+
+                # 1. Triage Agent (streamed: the RAG agent starts as soon as
+                # category and summary_ar are final, before the JSON is complete)
+                with st.spinner("🔄 Analyse en cours par les agents IA..."):
+                    analysis = triage_agent.analyze_complaint_early(user_input, start_rag)
+
                 if not analysis:
                      st.error("Erreur : L'agent de triage n'a renvoyé aucune réponse. Vérifiez la connexion API.")
                      return
 
-                # 2. RAG Agent
-                rag_agent = RAGAgent()
-                legal_advice = rag_agent.get_legal_advice(analysis.get('category', 'Général'), analysis.get('summary_ar', ''))
+                # 3. Reporting Agent: reads the advice chunks as they arrive
+                pool.submit(fan_out, reporting_agent.stream_report(analysis, advice_for_report), report_for_ui)
 
-                # 3. Reporting Agent
-                reporting_agent = ReportingAgent()
-                final_report = reporting_agent.generate_report(analysis, legal_advice)
-                
-                if not final_report:
-                    st.error("Erreur : Impossible de générer le rapport final.")
-                    return
+            # --- Results Display ---
+            
+            # Metrics
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Catégorie", analysis.get('category', 'N/A'))
+            c2.metric("Urgence", analysis.get('urgency', 'N/A'))
+            c3.metric("Langue Détectée", analysis.get('original_language', 'N/A'))
+            st.markdown("<br>", unsafe_allow_html=True)
 
-                # --- Results Display ---
-                
-                # Metrics
-                c1, c2, c3 = st.columns(3)
-                c1.metric("Catégorie", analysis.get('category', 'N/A'))
-                c2.metric("Urgence", analysis.get('urgency', 'N/A'))
-                c3.metric("Langue Détectée", analysis.get('original_language', 'N/A'))
-                st.markdown("<br>", unsafe_allow_html=True)
-
-                # Cards (Summaries only)
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown(f"""
-                        <div class='glass-card' style='border-left: 4px solid #0040ff;'>
-                            <h4 style='color: white;'>📄 Résumé Administratif</h4>
-                            <p style='color: #ccc; font-size: 0.9em;'>{analysis.get('summary_ar', 'N/A')}</p>
-                        </div>
-                    """, unsafe_allow_html=True)
-                
-                with col2:
-                    st.markdown(f"""
-                        <div class='glass-card' style='border-left: 4px solid #0040ff;'>
-                            <h4 style='color: white;'>⚖️ Avis Juridique</h4>
-                            <div style='color: #ccc; font-size: 0.9em;'>{legal_advice if legal_advice else "Non disponible"}</div>
-                        </div>
-                    """, unsafe_allow_html=True)
-
-                # Final Success Message and Download (Unified)
-                st.markdown("<br>", unsafe_allow_html=True)
+            # Cards (Summaries only)
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown(f"""
+                    <div class='glass-card' style='border-left: 4px solid #0040ff;'>
+                        <h4 style='color: white;'>📄 Résumé Administratif</h4>
+                        <p style='color: #ccc; font-size: 0.9em;'>{analysis.get('summary_ar', 'N/A')}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            
+            # 2. RAG Agent (already streaming): render it token by token
+            with col2:
+                advice_placeholder = st.empty()
+            legal_advice = ""
+            for chunk in advice_for_ui:
+                legal_advice += chunk
+                render_advice_card(advice_placeholder, legal_advice + " ▌")
+            render_advice_card(advice_placeholder, legal_advice if legal_advice else "Non disponible")
+
+            # Final report, streamed as well
+            st.markdown("<br>", unsafe_allow_html=True)
+            report_placeholder = st.empty()
+            final_report = ""
+            for chunk in report_for_ui:
+                final_report += chunk
+                report_placeholder.markdown(final_report + " ▌")
+            report_placeholder.markdown(final_report)
+            
+            if not final_report:
+                st.error("Erreur : Impossible de générer le rapport final.")
+                return
+
+            # Final Success Message and Download (Unified)
+            st.markdown("<br>", unsafe_allow_html=True)
+            
+            pdf_bytes = create_pdf(final_report)
+            if pdf_bytes:
+                b64_pdf = base64.b64encode(pdf_bytes).decode()
+                href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="rapport_decisionnel.pdf" class="custom-download-btn">📥 Télécharger le Rapport Officiel (PDF)</a>'
                 
-                pdf_bytes = create_pdf(final_report)
-                if pdf_bytes:
-                    b64_pdf = base64.b64encode(pdf_bytes).decode()
-                    href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="rapport_decisionnel.pdf" class="custom-download-btn">📥 Télécharger le Rapport Officiel (PDF)</a>'
-                    
-                    st.markdown(f"""
-                        <div class='download-card'>
-                            <h3 style='color: white; margin-bottom: 10px;'>✅ Analyse complétée avec succès</h3>
-                            <p style='color: rgba(255,255,255,0.7); margin-bottom: 20px;'>Votre rapport est prêt ci-dessous.</p>
-                            {href}
-                        </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.error("Erreur lors de la génération du PDF.")
-
-            except Exception as e:
-                st.error(f"Une erreur système est survenue : {e}")
+                st.markdown(f"""
+                    <div class='download-card'>
+                        <h3 style='color: white; margin-bottom: 10px;'>✅ Analyse complétée avec succès</h3>
+                        <p style='color: rgba(255,255,255,0.7); margin-bottom: 20px;'>Votre rapport est prêt ci-dessous.</p>
+                        {href}
+                    </div>
+                """, unsafe_allow_html=True)
+            else:
+                st.error("Erreur lors de la génération du PDF.")
+
+        except Exception as e:
+            st.error(f"Une erreur système est survenue : {e}")
 
 # --- 7. Main Loop ---
+@st.cache_resource(show_spinner=False)
+def _warm_up_agents():
+    # Runs once per process: every session then reuses the same agents
+    registry.warm_up()
+    return True
+
 if st.session_state['logged_in']:
+    if registry is not None:
+        try:
+            _warm_up_agents()
+        except Exception as e:
+            st.error(f"Erreur lors de l'initialisation des agents : {e}")
     dashboard_view()
 else:
     login_view()
\ No newline at end of file
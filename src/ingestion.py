@@ -1,51 +1,357 @@
 import os
+import json
+import hashlib
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
+from src.tools.retriever import get_embeddings, get_retriever, PERSIST_DIRECTORY
+from src.tools.embedding_stage import EmbeddingStage, EMBED_BATCH_SIZE, EMBED_MAX_PARALLEL
+from src.tools.articles import ArticleSegmenter, ArticleIndex, ARTICLE_INDEX_PATH
+from src.tools.bm25 import BM25Index, BM25_INDEX_PATH
+from src.tools.flat_index import FlatVectorStore, FLAT_INDEX_DIRECTORY, FLAT_INDEX_DTYPE
+from src.tools.sectors import sector_metadata, SECTORS_VERSION
+from src.tools.context_packs import ContextPacks, corpus_fingerprint, CONTEXT_PACKS_PATH
 
 # تحميل المتغيرات من .env
 load_dotenv()
 
-def ingest_docs():
-    # تأكدي أن الملف كاين ف هاد المسار
-    pdf_path = "data/raw/loi_113_14.pdf"
-    persist_directory = "data/processed/chroma_db"
+RAW_DIRECTORY = "data/raw"
+# كيتسجل فيه hash ديال كل ملف و الـ ids ديال القطع ديالو، باش نعرفو شنو تبدل
+MANIFEST_PATH = "data/processed/manifest.json"
+MANIFEST_VERSION = 1
+# حجم الدفعات ديال الحذف
+ADD_BATCH_SIZE = 128
+# الصفحات كتقرا و تتقسم ف processes منفصلين، بالدفعات
+PAGES_PER_TASK = 8
+DEFAULT_WORKERS = os.cpu_count() or 1
+# "fixed": 1000/100 splitter ; "articles": مادة بمادة (src/tools/articles.py)
+CHUNKING_MODES = ("fixed", "articles")
+DEFAULT_CHUNKING = os.getenv("INGESTION_CHUNKING", "fixed")
 
-    if not os.path.exists(pdf_path):
-        print(f"❌ Error: الملف {pdf_path} غير موجود!")
-        return
+def list_sources(raw_directory=RAW_DIRECTORY):
+    """Every PDF under `raw_directory` (recursively), skipping hidden/checkpoint folders."""
+    sources = []
+    for root, dirs, files in os.walk(raw_directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                sources.append(os.path.join(root, name))
+    return sources
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(source, text):
+    """Stable id of a chunk: same file + same text -> same id across runs."""
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "sources": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    # Write then rename, so an interrupted run never leaves a truncated manifest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
 
-    print(f"--- جاري قراءة الملف: {pdf_path} ---")
-    loader = PyPDFLoader(pdf_path)
-    raw_documents = loader.load()
-    
+def count_pages(pdf_path):
+    return len(PdfReader(pdf_path).pages)
+
+def _split_pages(pdf_path, start, stop):
+    """
+    Worker task: extract and split pages [start, stop) of one PDF.
+
+    Returns plain (text, metadata) tuples, cheaper to send back between
+    processes than Document objects. Splitting is per page, exactly like
+    PyPDFLoader + split_documents did.
+    """
+    reader = PdfReader(pdf_path)
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=100
     )
-    docs = text_splitter.split_documents(raw_documents)
-    print(f"--- تم تقسيم النص إلى {len(docs)} قطعة ---")
-
-    # التعديل المهم لـ OpenRouter
-    embeddings = OpenAIEmbeddings(
-        model="openai/text-embedding-3-small", # زيدي 'openai/' قبل اسم الموديل ف OpenRouter
-        openai_api_key=os.getenv("OPENROUTER_API_KEY", "").strip(),
-        openai_api_base=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").strip().rstrip('/') # كنحيدو الـ slash الأخير لضمان الخدمة
+    chunks = []
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text() or ""
+        metadata = {"source": pdf_path, "page": page_number, "total_pages": len(reader.pages)}
+        for piece in text_splitter.split_text(text):
+            chunks.append((piece, metadata))
+    return chunks
+
+def _extract_pages(pdf_path, start, stop):
+    """Worker task: raw text of pages [start, stop), for the article segmenter."""
+    reader = PdfReader(pdf_path)
+    return [(page_number, reader.pages[page_number].extract_text() or "") for page_number in range(start, stop)]
+
+def _ordered_map(pool, task, pdf_path, ranges, max_pending=None):
+    """Run `task` over page ranges on `pool`, yielding results in page order."""
+    if pool is None:
+        for start, stop in ranges:
+            yield task(pdf_path, start, stop)
+        return
+
+    max_pending = max_pending or 2 * getattr(pool, "_max_workers", DEFAULT_WORKERS)
+    pending = deque()
+    for start, stop in ranges:
+        pending.append(pool.submit(task, pdf_path, start, stop))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def iter_chunks(pdf_path, pool=None, chunking=DEFAULT_CHUNKING, pages_per_task=PAGES_PER_TASK, max_pending=None):
+    """
+    Yield the chunks of one PDF as Documents, in page order.
+
+    Page ranges are parsed on `pool` (a process pool) with at most
+    `max_pending` ranges in flight, so memory stays flat whatever the size of
+    the file. Without a pool everything runs in this process.
+
+    `chunking="articles"` segments on the law's own headings (one chunk per
+    المادة, with article/section metadata) instead of the fixed splitter.
+    """
+    total = count_pages(pdf_path)
+    ranges = ((start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task))
+    if chunking == "articles":
+        segmenter = ArticleSegmenter(pdf_path)
+        for pages in _ordered_map(pool, _extract_pages, pdf_path, ranges, max_pending):
+            for page_number, text in pages:
+                yield from segmenter.feed(page_number, text)
+        yield from segmenter.finish()
+        if not segmenter.articles_found:
+            print(f"--- ⚠️ ما تلقات حتى مادة ف {pdf_path}: تقسيم عادي ---")
+        return
+
+    for chunks in _ordered_map(pool, _split_pages, pdf_path, ranges, max_pending):
+        for text, metadata in chunks:
+            yield Document(page_content=text, metadata=dict(metadata))
+
+def _collect(docs, articles):
+    """Pass chunks through, keeping the article ones for the article index."""
+    for doc in docs:
+        if doc.metadata.get("article") is not None:
+            articles.append(doc)
+        yield doc
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _new_chunks(source, docs, old_ids, seen_ids, on_chunk=None):
+    """
+    Give each chunk its stable id and sector tags, and yield (id, doc) for the
+    ones not already in the store. Every id of the file ends up in `seen_ids`
+    (with its sectors string) and, stored or not, goes through `on_chunk`;
+    exact duplicate chunks inside one file are dropped.
+    """
+    for doc in docs:
+        doc_id = chunk_id(source, doc.page_content)
+        if doc_id in seen_ids:
+            continue
+        doc.metadata["chunk_id"] = doc_id
+        doc.metadata.update(sector_metadata(doc.page_content))
+        seen_ids[doc_id] = doc.metadata["sectors"]
+        if on_chunk is not None:
+            on_chunk(doc)
+        if doc_id in old_ids:
+            continue
+        yield doc_id, doc
+
+def _delete(vectorstore, ids):
+    ids = list(ids)
+    for start in range(0, len(ids), ADD_BATCH_SIZE):
+        vectorstore.delete(ids=ids[start:start + ADD_BATCH_SIZE])
+
+def ingest_docs(raw_directory=RAW_DIRECTORY, persist_directory=PERSIST_DIRECTORY, manifest_path=MANIFEST_PATH,
+                force=False, workers=DEFAULT_WORKERS, batch_size=EMBED_BATCH_SIZE, max_parallel=EMBED_MAX_PARALLEL,
+                chunking=DEFAULT_CHUNKING, article_index_path=ARTICLE_INDEX_PATH, bm25_index_path=BM25_INDEX_PATH,
+                flat_index_directory=FLAT_INDEX_DIRECTORY, flat_index_dtype=FLAT_INDEX_DTYPE,
+                context_packs_path=CONTEXT_PACKS_PATH):
+    """
+    Incremental, streaming ingestion of every PDF under `raw_directory`.
+
+    Unchanged files are skipped from their hash alone; for changed files only
+    chunks that are not already in the store get embedded, and chunks that
+    disappeared (or whose file was removed) are deleted. `force` re-checks
+    every file even if its hash did not change.
+
+    Pages are parsed and split across `workers` processes and chunks reach the
+    embedder/vector store in batches of `batch_size`, and go into the BM25
+    index one by one, so no file is ever held in memory as a whole (the BM25
+    index itself, being in-process, does grow with the corpus). `workers=1`
+    keeps everything in this process.
+
+    Embedding goes through EmbeddingStage (at most `max_parallel` requests,
+    rate-limited, retried on 429/5xx). The manifest is checkpointed after every
+    stored batch, so an interrupted run resumes without re-embedding what was
+    already stored.
+
+    Every file's manifest entry records its chunk count per sector, so
+    RAGAgent does not search a sector partition too small to fill a context.
+
+    With `chunking="articles"` the article index used by RAGAgent for explicit
+    article references is rebuilt for every file that is (re)processed.
+
+    The BM25 index (hybrid and lexical retrieval) is updated with the chunks of
+    every (re)processed file and saved once at the end of the run; a file it
+    does not hold with exactly the manifest's chunks (new index, interrupted
+    run) is re-chunked, without re-embedding, to fill it.
+
+    Whenever the collection changed (or `flat_index_directory` does not exist
+    yet, or has another dtype), it is exported to the memory-mapped flat index used by
+    VECTOR_BACKEND=flat / flat_int8. `flat_index_directory=None` skips the export.
+
+    The per-category context packs are rebuilt whenever the corpus fingerprint
+    (all chunk ids of the manifest) differs from the one they were built for.
+    `context_packs_path=None` skips them.
+    """
+    sources = list_sources(raw_directory)
+    if not sources:
+        print(f"❌ Error: ما كاين حتى ملف PDF ف {raw_directory}!")
+        return
+
+    # التعديل المهم لـ OpenRouter (نفس الـ embeddings ديال الـ retriever، مع الكاش:
+    # القطع اللي ما تبدلاتش ما كتعاودش تمشي للـ API)
+    embeddings = get_embeddings(
+        base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").strip().rstrip('/'), # كنحيدو الـ slash الأخير لضمان الخدمة
+        max_retries=0 # الـ retries كيديرهم الـ EmbeddingStage
     )
-    
-    print("--- جاري إنشاء الـ Vector DB... (انتظري قليلاً) ---")
-    
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=persist_directory
+    stage = EmbeddingStage(embeddings, batch_size=batch_size, max_parallel=max_parallel)
+    vectorstore = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embeddings
     )
-    
+
+    manifest = load_manifest(manifest_path)
+    article_index = ArticleIndex(article_index_path)
+    lexical_index = BM25Index(bm25_index_path)
+    if not manifest["sources"] and vectorstore._collection.count():
+        # قاعدة قديمة تصاوبات بـ from_documents (ids عشوائية): كنبداو من الصفر مرة وحدة
+        print("--- قاعدة بيانات قديمة بلا manifest: إعادة البناء مرة وحدة ---")
+        vectorstore.delete_collection()
+        vectorstore = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embeddings
+        )
+
+    added = deleted = 0
+    lexical_changed = False
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for pdf_path in sources:
+            digest = file_sha256(pdf_path)
+            entry = manifest["sources"].get(pdf_path)
+            # Switching chunking mode changes every chunk: the file is redone
+            if (entry and entry["sha256"] == digest and entry.get("chunking", "fixed") == chunking
+                    and entry.get("sectors") == SECTORS_VERSION and "sector_counts" in entry
+                    and lexical_index.has_chunks(pdf_path, entry["chunks"]) and not force):
+                print(f"--- بدون تغيير: {pdf_path} ---")
+                continue
+
+            print(f"--- جاري قراءة الملف: {pdf_path} ---")
+            # An entry whose sha256 differs from the file is either an older
+            # version or an interrupted run: its chunks are already stored.
+            entry = manifest["sources"].setdefault(pdf_path, {"sha256": None, "sectors": SECTORS_VERSION, "chunks": []})
+            # Chunks tagged with another sector lexicon are stored again with the
+            # new tags (their vectors come from the embedding cache)
+            old_ids = set(entry["chunks"])
+            stored_ids = old_ids if entry.get("sectors") == SECTORS_VERSION else set()
+            # dict rather than set: keeps the chunk order (and their sectors) for the manifest
+            seen_ids = {}
+            article_docs = []
+            lexical_changed = True
+            chunks = _collect(iter_chunks(pdf_path, pool, chunking), article_docs)
+            new_chunks = _new_chunks(pdf_path, chunks, stored_ids, seen_ids,
+                                     on_chunk=lambda doc: lexical_index.add(pdf_path, doc))
+            for batch, vectors in stage.embed_batches(batched(new_chunks, batch_size)):
+                ids = [doc_id for doc_id, _ in batch]
+                vectorstore._collection.upsert(
+                    ids=ids,
+                    embeddings=vectors,
+                    documents=[doc.page_content for _, doc in batch],
+                    metadatas=[doc.metadata for _, doc in batch]
+                )
+                # Checkpoint: these chunks survive an interruption
+                entry["chunks"].extend(ids)
+                save_manifest(manifest, manifest_path)
+                added += len(batch)
+            print(f"--- تم تقسيم النص إلى {len(seen_ids)} قطعة ---")
+
+            stale = old_ids - seen_ids.keys()
+            _delete(vectorstore, stale)
+            deleted += len(stale)
+
+            # Chunks per sector: RAGAgent only searches a partition that can fill a context
+            sector_counts = Counter(code for sectors in seen_ids.values() for code in sectors.split(","))
+            manifest["sources"][pdf_path] = {"sha256": digest, "chunking": chunking, "sectors": SECTORS_VERSION,
+                                             "sector_counts": dict(sector_counts), "chunks": list(seen_ids)}
+            save_manifest(manifest, manifest_path)
+            article_index.replace_source(pdf_path, article_docs)
+            article_index.save()
+            lexical_index.prune_source(pdf_path, seen_ids)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # ملفات تحيدات من data/raw
+    for pdf_path in sorted(set(manifest["sources"]) - set(sources)):
+        print(f"--- ملف محذوف: {pdf_path} ---")
+        stale = manifest["sources"].pop(pdf_path)["chunks"]
+        _delete(vectorstore, stale)
+        deleted += len(stale)
+        save_manifest(manifest, manifest_path)
+        article_index.remove_source(pdf_path)
+        article_index.save()
+        lexical_index.remove_source(pdf_path)
+        lexical_changed = True
+    if lexical_changed:
+        lexical_index.save()
+
     # حفظ البيانات محلياً
-    vectorstore.persist() 
-    print(f"✅ تم بنجاح! قاعدة البيانات محفوظة في: {persist_directory}")
+    vectorstore.persist()
+    if flat_index_directory and (added or deleted or not FlatVectorStore.exists(flat_index_directory)
+                                 or FlatVectorStore.stored_dtype(flat_index_directory) != flat_index_dtype):
+        rows = FlatVectorStore.export_from_chroma(vectorstore._collection, flat_index_directory, dtype=flat_index_dtype)
+        print(f"--- Flat index ({flat_index_dtype}): {rows} قطعة ف {flat_index_directory} ---")
+    if context_packs_path:
+        fingerprint = corpus_fingerprint(manifest)
+        packs = ContextPacks(context_packs_path, manifest_path=None)
+        if not packs.is_current(fingerprint):
+            packs.build(get_retriever(vectorstore, lexical_index=lexical_index), fingerprint)
+            packs.save()
+            print(f"--- Context packs: {len(packs)} قطاعات ف {context_packs_path} ---")
+    print(f"✅ تم بنجاح! +{added} قطعة، -{deleted} قطعة. قاعدة البيانات محفوظة في: {persist_directory}")
 
 if __name__ == "__main__":
-    ingest_docs()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingestion incrémentale des textes juridiques (PDF)")
+    parser.add_argument("--raw-dir", default=RAW_DIRECTORY, help="dossier des PDF sources")
+    parser.add_argument("--force", action="store_true", help="revérifier tous les fichiers même inchangés")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="processus de lecture/découpage des PDF")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks par requête d'embedding")
+    parser.add_argument("--parallel", type=int, default=EMBED_MAX_PARALLEL, help="requêtes d'embedding simultanées")
+    parser.add_argument("--chunking", choices=CHUNKING_MODES, default=DEFAULT_CHUNKING, help="découpage fixe ou article par article")
+    parser.add_argument("--flat-dtype", choices=("float32", "float16"), default=FLAT_INDEX_DTYPE, help="précision de l'index vectoriel mmap")
+    args = parser.parse_args()
+    ingest_docs(raw_directory=args.raw_dir, force=args.force, workers=args.workers,
+                batch_size=args.batch_size, max_parallel=args.parallel, chunking=args.chunking,
+                flat_index_dtype=args.flat_dtype)
@@ -1,15 +1,37 @@
 import os
+import sys
+import json
+import time
+import logging
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
-# استيراد الوكلاء اللي صاوبنا
-from src.agents.triage_agent import TriageAgent
-from src.agents.rag_agent import RAGAgent
+# استيراد الوكلاء اللي صاوبنا (مشاركين عبر الـ registry)
+from src import registry
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_WORKERS = 8
+DEFAULT_ASYNC_CONCURRENCY = 100
+
+# "sequential": triage, then retrieval + legal advice
+# "speculative": retrieval on the raw complaint runs while triage is in flight
+# "early": triage is streamed and RAG starts as soon as category/summary_ar are final
+# "fused": one LLM call returns the triage, the legal advice and the report
+# (retrieval on the raw complaint); falls back to "sequential" if its JSON is invalid
+PIPELINE_MODES = ("sequential", "speculative", "early", "fused")
+DEFAULT_PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sequential")
+
 class ComplaintsSystem:
-    def __init__(self):
-        self.triage_agent = TriageAgent()
-        self.rag_agent = RAGAgent()
+    def __init__(self, mode=DEFAULT_PIPELINE_MODE):
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode {mode!r}, expected one of {PIPELINE_MODES}")
+        self.mode = mode
+        self.triage_agent = registry.get_triage_agent()
+        self.rag_agent = registry.get_rag_agent()
 
     def process_new_complaint(self, text):
         print("\n" + "="*50)
@@ -35,7 +57,313 @@ class ComplaintsSystem:
         
         return final_report
 
-if __name__ == "__main__":
+    def _process_quietly(self, text, mode=None):
+        """Triage -> RAG without any console output (used by the batch mode)."""
+        mode = mode or self.mode
+        if mode == "fused":
+            try:
+                return registry.get_fused_agent().process(text)
+            except ValueError as e:
+                logger.warning("Fused answer rejected, using the agents: %s", e)
+                mode = "sequential"
+        if mode == "early":
+            return self._process_early(text)
+
+        prefetch = None
+        if mode == "speculative":
+            prefetch = registry.get_stage_pool().submit(self.rag_agent.prefetch, text)
+
+        analysis = self.triage_agent.analyze_complaint(text)
+        legal_report = self.rag_agent.get_legal_advice(
+            analysis['category'],
+            analysis['summary_ar'],
+            prefetched_docs=self._prefetched(prefetch)
+        )
+        return {
+            "metadata": analysis,
+            "legal_basis": legal_report
+        }
+
+    async def aprocess_complaint(self, text, mode=None):
+        """Async triage -> RAG: one event loop can keep hundreds of these in flight."""
+        mode = mode or self.mode
+        if mode == "fused":
+            try:
+                return await registry.get_fused_agent().aprocess(text)
+            except ValueError as e:
+                logger.warning("Fused answer rejected, using the agents: %s", e)
+                mode = "sequential"
+        if mode == "early":
+            return await self._aprocess_early(text)
+
+        prefetch = None
+        if mode == "speculative":
+            prefetch = asyncio.ensure_future(self.rag_agent.aprefetch(text))
+
+        try:
+            analysis = await self.triage_agent.aanalyze_complaint(text)
+        except BaseException:
+            if prefetch is not None:
+                prefetch.cancel()
+            raise
+        legal_report = await self.rag_agent.aget_legal_advice(
+            analysis['category'],
+            analysis['summary_ar'],
+            prefetched_docs=await self._aprefetched(prefetch)
+        )
+        return {
+            "metadata": analysis,
+            "legal_basis": legal_report
+        }
+
+    def _process_early(self, text):
+        rag = {}
+
+        def start_rag(partial):
+            rag["future"] = registry.get_stage_pool().submit(
+                self.rag_agent.get_legal_advice,
+                partial['category'],
+                partial['summary_ar']
+            )
+
+        try:
+            analysis = self.triage_agent.analyze_complaint_early(text, start_rag)
+        except BaseException:
+            if "future" in rag:
+                rag["future"].cancel()
+            raise
+        return {
+            "metadata": analysis,
+            "legal_basis": rag["future"].result()
+        }
+
+    async def _aprocess_early(self, text):
+        rag = {}
+
+        def start_rag(partial):
+            rag["task"] = asyncio.ensure_future(self.rag_agent.aget_legal_advice(
+                partial['category'],
+                partial['summary_ar']
+            ))
+
+        try:
+            analysis = await self.triage_agent.aanalyze_complaint_early(text, start_rag)
+        except BaseException:
+            if "task" in rag:
+                rag["task"].cancel()
+            raise
+        return {
+            "metadata": analysis,
+            "legal_basis": await rag["task"]
+        }
+
+    @staticmethod
+    def _prefetched(prefetch):
+        # A failed speculative retrieval is not fatal: RAG just retrieves normally
+        if prefetch is None:
+            return None
+        try:
+            return prefetch.result()
+        except Exception as e:
+            logger.warning("Speculative retrieval failed, falling back: %s", e)
+            return None
+
+    @staticmethod
+    async def _aprefetched(prefetch):
+        if prefetch is None:
+            return None
+        try:
+            return await prefetch
+        except Exception as e:
+            logger.warning("Speculative retrieval failed, falling back: %s", e)
+            return None
+
+    @staticmethod
+    def _result_record(complaint_id, started, report=None, error=None):
+        elapsed = round(time.perf_counter() - started, 3)
+        if error is not None:
+            logger.warning("Complaint %s failed: %s", complaint_id, error)
+            return {"id": complaint_id, "status": "error", "error": str(error), "elapsed_s": elapsed}
+        return {"id": complaint_id, "status": "ok", **report, "elapsed_s": elapsed}
+
+    def _process_record(self, complaint_id, text):
+        started = time.perf_counter()
+        try:
+            report = self._process_quietly(text)
+        except Exception as e:
+            return self._result_record(complaint_id, started, error=e)
+        return self._result_record(complaint_id, started, report=report)
+
+    async def _aprocess_record(self, complaint_id, text):
+        started = time.perf_counter()
+        try:
+            report = await self.aprocess_complaint(text)
+        except Exception as e:
+            return self._result_record(complaint_id, started, error=e)
+        return self._result_record(complaint_id, started, report=report)
+
+    def process_batch(self, complaints, max_workers=DEFAULT_BATCH_WORKERS):
+        """
+        Run (id, text) pairs through triage -> RAG with at most `max_workers`
+        complaints in flight, yielding one result dict per complaint as soon as
+        it finishes (completion order, not input order).
+
+        The input is consumed lazily, so an arbitrarily large file never sits
+        in memory; a failed complaint yields a record with status "error"
+        instead of aborting the batch.
+        """
+        complaints = iter(complaints)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            exhausted = False
+            while True:
+                # Keep the pool fed without reading the whole input up front
+                while not exhausted and len(pending) < max_workers * 2:
+                    try:
+                        complaint_id, text = next(complaints)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(executor.submit(self._process_record, complaint_id, text))
+
+                if not pending:
+                    return
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    async def aprocess_batch(self, complaints, concurrency=DEFAULT_ASYNC_CONCURRENCY):
+        """
+        Async counterpart of process_batch: at most `concurrency` complaints in
+        flight on the current event loop, results yielded in completion order.
+        """
+        complaints = iter(complaints)
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    complaint_id, text = next(complaints)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(self._aprocess_record(complaint_id, text)))
+
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+
+def read_complaints_jsonl(stream):
+    """
+    Yield (id, text) pairs from a JSONL stream.
+
+    Each line is an object with the complaint in "text" (or "complaint") and an
+    optional "id". Lines without an id get a stable one from their line number
+    so results can be matched back to the input whatever order they finish in.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.warning("Line %d is not valid JSON (%s), skipped", line_number, e)
+            continue
+        text = record.get("text") or record.get("complaint")
+        if not text:
+            logger.warning("Line %d has no complaint text, skipped", line_number)
+            continue
+        complaint_id = record.get("id")
+        if complaint_id is None:
+            complaint_id = f"line-{line_number}"
+        yield str(complaint_id), text
+
+
+def _open_batch_streams(input_path, output_path):
+    source = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    sink = sys.stdout if output_path == "-" else open(output_path, "w", encoding="utf-8")
+    return source, sink
+
+
+class _BatchWriter:
+    """Streams result records to JSONL as they arrive and keeps the counters."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.processed = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def write(self, result):
+        self.sink.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.sink.flush()
+        self.processed += 1
+        if result["status"] != "ok":
+            self.failed += 1
+        if self.processed % 100 == 0:
+            logger.info("%d complaints processed (%d failed)", self.processed, self.failed)
+
+    def close(self):
+        logger.info(
+            "Batch done: %d complaints, %d failed, %.1fs",
+            self.processed, self.failed, time.perf_counter() - self.started
+        )
+
+
+def run_batch(input_path, output_path, max_workers=DEFAULT_BATCH_WORKERS, mode=DEFAULT_PIPELINE_MODE):
+    system = ComplaintsSystem(mode=mode)
+    source, sink = _open_batch_streams(input_path, output_path)
+    writer = _BatchWriter(sink)
+    try:
+        for result in system.process_batch(read_complaints_jsonl(source), max_workers=max_workers):
+            writer.write(result)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    writer.close()
+
+
+async def arun_batch(input_path, output_path, concurrency=DEFAULT_ASYNC_CONCURRENCY, mode=DEFAULT_PIPELINE_MODE):
+    system = ComplaintsSystem(mode=mode)
+    source, sink = _open_batch_streams(input_path, output_path)
+    writer = _BatchWriter(sink)
+    try:
+        async for result in system.aprocess_batch(read_complaints_jsonl(source), concurrency=concurrency):
+            writer.write(result)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traitement des plaintes citoyennes (Loi 113.14)")
+    parser.add_argument("--batch", metavar="INPUT", help="fichier JSONL des plaintes ('-' pour stdin)")
+    parser.add_argument("--output", default="-", help="fichier JSONL des résultats ('-' pour stdout)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS, help="plaintes traitées en parallèle (mode threads)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="utiliser la boucle asyncio au lieu des threads")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_ASYNC_CONCURRENCY, help="plaintes en vol en mode --async")
+    parser.add_argument("--mode", choices=PIPELINE_MODES, default=DEFAULT_PIPELINE_MODE, help="mode du pipeline triage -> RAG")
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(levelname)s %(message)s")
+        if args.use_async:
+            asyncio.run(arun_batch(args.batch, args.output, concurrency=args.concurrency, mode=args.mode))
+        else:
+            run_batch(args.batch, args.output, max_workers=args.workers, mode=args.mode)
+        return
+
     system = ComplaintsSystem()
     
     # مثال لشكاية بالدارجة
@@ -46,4 +374,7 @@ if __name__ == "__main__":
     print("\n📝 التقرير النهائي:")
     print(f"الموضوع: {report['metadata']['summary_ar']}")
     print(f"الرأي القانوني:\n{report['legal_basis']}")
-    print("="*50 + "\n")
\ No newline at end of file
+    print("="*50 + "\n")
+
+if __name__ == "__main__":
+    main()
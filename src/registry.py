@@ -0,0 +1,162 @@
+"""
+Process-wide registry for the agents and the vector store.
+
+Streamlit reruns the script on every interaction, so building the agents inside
+the view meant a new ChatOpenAI client, new embeddings and a fresh Chroma client
+on every click. Everything here is built once per process and shared by every
+session and thread.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.tools.retriever import get_embeddings as _build_embeddings
+from src.tools.retriever import get_vectorstore as _build_vectorstore
+from src.tools.retriever import get_retriever as _build_retriever
+from src.tools.retriever import RETRIEVAL_MODE
+
+_lock = threading.RLock()
+_instances = {}
+
+# Background pool for pipeline stages that overlap with triage (speculative
+# retrieval, early RAG start). Survives reload(): it holds no model state.
+STAGE_POOL_WORKERS = 16
+_stage_pool = None
+
+
+def _get_or_build(name, factory):
+    # Fast path without the lock: dict reads are atomic.
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        instance = _instances.get(name)
+        if instance is None:
+            instance = factory()
+            _instances[name] = instance
+        return instance
+
+
+def get_embeddings():
+    return _get_or_build("embeddings", _build_embeddings)
+
+
+def get_vectorstore():
+    return _get_or_build("vectorstore", lambda: _build_vectorstore(get_embeddings()))
+
+
+def get_lexical_index():
+    from src.tools.bm25 import BM25Index
+    return _get_or_build("lexical_index", BM25Index)
+
+
+def _retriever_factory():
+    if RETRIEVAL_MODE == "vector":
+        return _build_retriever(get_vectorstore(), mode="vector")
+    # Lexical mode never touches the vector store
+    vectorstore = get_vectorstore() if RETRIEVAL_MODE == "hybrid" else None
+    return _build_retriever(vectorstore, mode=RETRIEVAL_MODE, lexical_index=get_lexical_index())
+
+
+def get_retriever():
+    return _get_or_build("retriever", _retriever_factory)
+
+
+def get_semantic_cache():
+    """Near-duplicate triage cache, or None when TRIAGE_SEMANTIC_CACHE=0."""
+    from src.tools.semantic_cache import SemanticTriageCache, SEMANTIC_CACHE_ENABLED
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    return _get_or_build("semantic_cache", lambda: SemanticTriageCache(get_embeddings()))
+
+
+def get_model_router():
+    from src.tools.model_router import ModelRouter
+    return _get_or_build("model_router", ModelRouter)
+
+
+def get_triage_classifier():
+    """Local triage classifier, or None when TRIAGE_LOCAL=0 or no model was trained yet."""
+    from src.tools.triage_classifier import TriageClassifier, TRIAGE_LOCAL_ENABLED, TRIAGE_MODEL_PATH
+    if not TRIAGE_LOCAL_ENABLED or not os.path.exists(TRIAGE_MODEL_PATH):
+        return None
+    return _get_or_build("triage_classifier", TriageClassifier.load)
+
+
+def get_triage_agent():
+    from src.agents.triage_agent import TriageAgent
+    return _get_or_build("triage_agent", lambda: TriageAgent(
+        semantic_cache=get_semantic_cache(),
+        classifier=get_triage_classifier(),
+        router=get_model_router()
+    ))
+
+
+def get_llm_cache_stats():
+    """Hit/miss counters of the shared LLM cache (all agents), {} when it is disabled."""
+    cache = get_triage_agent().llm_cache
+    return cache.stats() if cache is not None else {}
+
+
+def get_article_index():
+    from src.tools.articles import ArticleIndex
+    return _get_or_build("article_index", ArticleIndex)
+
+
+def get_context_packs():
+    from src.tools.context_packs import ContextPacks
+    return _get_or_build("context_packs", ContextPacks)
+
+
+def get_rag_agent():
+    from src.agents.rag_agent import RAGAgent
+    return _get_or_build("rag_agent", lambda: RAGAgent(
+        retriever=get_retriever(),
+        article_index=get_article_index(),
+        context_packs=get_context_packs(),
+        lexical_index=get_lexical_index(),
+        router=get_model_router()
+    ))
+
+
+def get_fused_agent():
+    from src.agents.fused_agent import FusedAgent
+    return _get_or_build("fused_agent", lambda: FusedAgent(rag_agent=get_rag_agent(), router=get_model_router()))
+
+
+def get_reporting_agent():
+    from src.agents.reporter import ReportingAgent
+    return _get_or_build("reporting_agent", lambda: ReportingAgent(router=get_model_router()))
+
+
+def get_stage_pool():
+    global _stage_pool
+    if _stage_pool is None:
+        with _lock:
+            if _stage_pool is None:
+                _stage_pool = ThreadPoolExecutor(max_workers=STAGE_POOL_WORKERS, thread_name_prefix="rag-stage")
+    return _stage_pool
+
+
+def warm_up():
+    """Build every shared component now instead of on the first request."""
+    get_triage_agent()
+    get_rag_agent()
+    get_reporting_agent()
+
+
+def reload():
+    """
+    Drop every shared component and build fresh ones (e.g. after re-ingestion).
+
+    Requests already running keep the instances they hold; new requests get the
+    rebuilt ones.
+    """
+    with _lock:
+        _instances.clear()
+        warm_up()
+
+
+if __name__ == "__main__":
+    warm_up()
+    print(f"✅ Registry prêt : {', '.join(sorted(_instances))}")
@@ -0,0 +1,47 @@
+"""
+Arabic text normalization for lexical matching.
+
+The same word is written many ways in the law and in complaints: with or
+without hamza (الإنارة / الانارة), final ya or alef maqsura (على / علي), ta
+marbuta or ha (العمومية / العموميه), with diacritics or tatweel. Both the
+indexed chunks and the queries go through `normalize` so they meet on one
+spelling.
+"""
+import re
+
+_DIACRITICS = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+_TATWEEL = "\u0640"
+_FOLD = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي",
+    "ة": "ه",
+    "ؤ": "و",
+    "ئ": "ي",
+})
+# Definite article and its common attached prepositions (وال، بال، لل...)
+_ARTICLE_PREFIX = re.compile(r"^(?:و|ف|ب|ك)?(?:ال|لل)(?=\w{2,})")
+
+STOPWORDS = frozenset({
+    "في", "من", "الي", "علي", "عن", "مع", "او", "ثم", "حتي", "هذا", "هذه", "ذلك", "تلك",
+    "التي", "الذي", "الذين", "كل", "غير", "بين", "عند", "قد", "لا", "ما", "لم", "لن", "ان",
+    "هو", "هي", "هم", "كان", "كانت", "يكون", "تكون", "به", "بها", "له", "لها", "فيه", "فيها",
+    "le", "la", "les", "de", "des", "du", "et", "en", "un", "une", "au", "aux",
+})
+
+
+def normalize(text):
+    """Fold spelling variants, strip diacritics and tatweel, lowercase Latin."""
+    text = _DIACRITICS.sub("", text or "").replace(_TATWEEL, "")
+    return text.translate(_FOLD).lower()
+
+
+def tokenize(text):
+    """Normalized index terms of `text`: no stopwords, no definite article."""
+    terms = []
+    for token in re.findall(r"\w+", normalize(text)):
+        if token in STOPWORDS:
+            continue
+        token = _ARTICLE_PREFIX.sub("", token)
+        if len(token) > 1:
+            terms.append(token)
+    return terms
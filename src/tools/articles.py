@@ -0,0 +1,236 @@
+"""
+Article-aware segmentation of Moroccan legal texts and a direct article index.
+
+The fixed 1000/100 splitter cuts articles (المادة N) in half. Here the text is
+segmented on its own headings instead: every article becomes one chunk (split
+further only if it is very long), tagged with its number, title and the
+part/section/chapter it belongs to.
+
+The same pass fills an in-memory article index, persisted next to the vector
+DB, so an explicit reference such as "المادة 83" resolves to the article text
+with a dict lookup and no embedding call.
+"""
+import os
+import re
+import json
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+ARTICLE_INDEX_PATH = "data/processed/article_index.json"
+# Beyond this an article is split into several chunks (same metadata, "part" 1..n)
+MAX_ARTICLE_CHARS = 4000
+# Text outside any article (preamble, PDFs without headings) is flushed through
+# the regular splitter once it reaches this size, so memory stays bounded
+MAX_LOOSE_CHARS = 8000
+# A short line right after a part/section/chapter heading is taken as its title
+MAX_HEADING_TITLE_CHARS = 80
+
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_NUMBER = r"[0-9٠-٩۰-۹]+"
+
+ARTICLE_HEADING = re.compile(rf"^\s*المادة\s+(?P<number>{_NUMBER}|الأولى)\s*(?:[-–:.]\s*(?P<title>.*))?$")
+SECTION_HEADINGS = (
+    ("part", re.compile(r"^\s*(?:ال)?باب\s+\S+")),
+    ("section", re.compile(r"^\s*(?:ال)?قسم\s+\S+")),
+    ("chapter", re.compile(r"^\s*(?:ال)?فصل\s+\S+")),
+)
+_SECTION_LEVELS = [level for level, _ in SECTION_HEADINGS]
+
+# A number followed by ".14" is a law number ("المادة 113.14" is not article 113)
+_REFERENCE_NUMBER = rf"{_NUMBER}(?![0-9٠-٩۰-۹]|[.٫/][0-9٠-٩۰-۹])"
+ARTICLE_REFERENCE = re.compile(
+    rf"(?:المادة|المادتين|المواد|article|articles|art\.)\s*(?P<numbers>{_REFERENCE_NUMBER}(?:\s*(?:و|،|,|-|et)\s*{_REFERENCE_NUMBER})*)",
+    re.IGNORECASE
+)
+
+
+def to_int(number):
+    if number == "الأولى":
+        return 1
+    return int(number.translate(_DIGITS))
+
+
+def find_article_references(text):
+    """Article numbers explicitly cited in `text`, in order of appearance."""
+    numbers = []
+    for match in ARTICLE_REFERENCE.finditer(text or ""):
+        for number in re.findall(_NUMBER, match.group("numbers")):
+            value = to_int(number)
+            if value not in numbers:
+                numbers.append(value)
+    return numbers
+
+
+class ArticleSegmenter:
+    """
+    Streaming segmenter: feed pages in order, get finished chunks back as soon
+    as the next heading closes them. Only the current article is held in memory.
+    """
+
+    def __init__(self, source, max_article_chars=MAX_ARTICLE_CHARS):
+        self.source = source
+        self.max_article_chars = max_article_chars
+        self.articles_found = 0
+        self._headings = {}
+        # Heading whose title line ("أحكام عامة") has not been seen yet
+        self._untitled_level = None
+        self._article = None
+        self._lines = []
+        self._page = 0
+        self._splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        self._long_splitter = RecursiveCharacterTextSplitter(chunk_size=max_article_chars, chunk_overlap=0)
+
+    def _section(self):
+        return " > ".join(self._headings[level] for level in _SECTION_LEVELS if level in self._headings)
+
+    def _flush(self):
+        text = "\n".join(self._lines).strip()
+        self._lines = []
+        article, self._article = self._article, None
+        if not text:
+            return []
+        if article is None:
+            # Not inside an article: same chunks as the fixed splitter
+            return [
+                Document(page_content=piece, metadata={"source": self.source, "page": self._page})
+                for piece in self._splitter.split_text(text)
+            ]
+        pieces = [text] if len(text) <= self.max_article_chars else self._long_splitter.split_text(text)
+        return [
+            Document(page_content=piece, metadata={
+                "source": self.source,
+                "page": article["page"],
+                "article": article["number"],
+                "article_title": article["title"],
+                "section": article["section"],
+                "part": part,
+            })
+            for part, piece in enumerate(pieces, start=1)
+        ]
+
+    def feed(self, page_number, text):
+        finished = []
+        self._page = page_number
+        for line in (text or "").splitlines():
+            if not line.strip():
+                continue
+            match = ARTICLE_HEADING.match(line)
+            is_heading = match or any(pattern.match(line) for _, pattern in SECTION_HEADINGS)
+            if self._untitled_level and not is_heading:
+                level, self._untitled_level = self._untitled_level, None
+                if len(line.strip()) <= MAX_HEADING_TITLE_CHARS:
+                    self._headings[level] += f" ({line.strip()})"
+                    continue
+            self._untitled_level = None
+            if match:
+                finished.extend(self._flush())
+                self.articles_found += 1
+                self._article = {
+                    "number": to_int(match.group("number")),
+                    "title": (match.group("title") or "").strip(),
+                    "section": self._section(),
+                    "page": page_number,
+                }
+                self._lines.append(line.strip())
+                continue
+            for level, pattern in SECTION_HEADINGS:
+                if pattern.match(line):
+                    # A new part/section/chapter also ends the current article
+                    finished.extend(self._flush())
+                    self._headings[level] = line.strip()
+                    self._untitled_level = level
+                    # ...and resets the levels below it
+                    for lower in _SECTION_LEVELS[_SECTION_LEVELS.index(level) + 1:]:
+                        self._headings.pop(lower, None)
+                    break
+            else:
+                self._lines.append(line)
+                if self._article is None and sum(len(l) for l in self._lines) > MAX_LOOSE_CHARS:
+                    finished.extend(self._flush())
+        return finished
+
+    def finish(self):
+        return self._flush()
+
+
+class ArticleIndex:
+    """
+    article number -> article entries, per source file.
+
+    Persisted as JSON ({"sources": {source: {number: entry}}}) and merged in
+    memory into {number: [entry, ...]} for O(1) lookups.
+    """
+
+    def __init__(self, path=ARTICLE_INDEX_PATH):
+        self.path = path
+        self.sources = {}
+        self._by_number = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.sources = json.load(f).get("sources", {})
+        self._rebuild()
+
+    def _rebuild(self):
+        by_number = {}
+        for source in sorted(self.sources):
+            for number, entry in self.sources[source].items():
+                by_number.setdefault(int(number), []).append(entry)
+        self._by_number = by_number
+
+    def __len__(self):
+        return len(self._by_number)
+
+    def replace_source(self, source, docs):
+        """Replace every article of `source` with the article chunks in `docs`."""
+        articles = {}
+        for doc in docs:
+            number = doc.metadata.get("article")
+            if number is None:
+                continue
+            entry = articles.setdefault(str(number), {
+                "source": source,
+                "article": number,
+                "title": doc.metadata.get("article_title", ""),
+                "section": doc.metadata.get("section", ""),
+                "page": doc.metadata.get("page"),
+                "chunk_ids": [],
+                "text": "",
+            })
+            entry["chunk_ids"].append(doc.metadata.get("chunk_id"))
+            entry["text"] = (entry["text"] + "\n" + doc.page_content).strip()
+        if articles:
+            self.sources[source] = articles
+        else:
+            self.sources.pop(source, None)
+        self._rebuild()
+
+    def remove_source(self, source):
+        if self.sources.pop(source, None) is not None:
+            self._rebuild()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "sources": self.sources}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, number):
+        return self._by_number.get(number, [])
+
+    def documents_for(self, text, limit=3):
+        """Documents for the articles explicitly cited in `text` (no embedding involved)."""
+        docs = []
+        for number in find_article_references(text):
+            for entry in self.get(number):
+                docs.append(Document(page_content=entry["text"], metadata={
+                    "source": entry["source"],
+                    "page": entry.get("page"),
+                    "article": entry["article"],
+                    "article_title": entry.get("title", ""),
+                    "section": entry.get("section", ""),
+                }))
+                if len(docs) >= limit:
+                    return docs
+        return docs
@@ -0,0 +1,142 @@
+"""
+In-process BM25 inverted index over the ingested chunks.
+
+Built at ingestion time next to the vector DB and updated per source file
+(chunks are added/removed by their chunk_id, like in Chroma). Legal Arabic is
+full of exact terms (الإنارة العمومية، التطهير السائل) that a lexical match
+finds without any embedding call; terms go through `src.tools.arabic` so
+spelling variants still match.
+"""
+import os
+import json
+import math
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from src.tools.arabic import tokenize
+
+BM25_INDEX_PATH = "data/processed/bm25_index.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def _matches(metadata, where):
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+class BM25Index:
+    """
+    Persisted as JSON ({"sources": {source: {chunk_id: entry}}}), with the
+    postings (term -> {chunk_id: tf}) kept in memory and updated in place.
+    """
+
+    def __init__(self, path=BM25_INDEX_PATH, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.sources = {}
+        self._docs = {}
+        self._postings = {}
+        self._total_length = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.sources = json.load(f).get("sources", {})
+        for entries in self.sources.values():
+            for doc_id, entry in entries.items():
+                self._add(doc_id, entry)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def has_source(self, source):
+        return source in self.sources
+
+    def has_chunks(self, source, chunk_ids):
+        """True if `source` is indexed with exactly `chunk_ids`."""
+        return source in self.sources and set(self.sources[source]) == set(chunk_ids)
+
+    def _add(self, doc_id, entry):
+        if doc_id in self._docs:
+            self._remove(doc_id)
+        self._docs[doc_id] = entry
+        self._total_length += entry["length"]
+        for term, tf in entry["terms"].items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+    def _remove(self, doc_id):
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+        self._total_length -= entry["length"]
+        for term in entry["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    @staticmethod
+    def _entry(doc):
+        terms = Counter(tokenize(doc.page_content))
+        return {
+            "text": doc.page_content,
+            "metadata": doc.metadata,
+            "terms": dict(terms),
+            "length": sum(terms.values()),
+        }
+
+    def add(self, source, doc):
+        """Index one chunk (with its chunk_id) of `source`, replacing the entry of the same id."""
+        doc_id = doc.metadata.get("chunk_id")
+        if doc_id is None:
+            return
+        entry = self._entry(doc)
+        self._add(doc_id, entry)
+        self.sources.setdefault(source, {})[doc_id] = entry
+
+    def prune_source(self, source, chunk_ids):
+        """Drop the chunks of `source` that are not in `chunk_ids` (streamed ingestion, see `add`)."""
+        entries = self.sources.setdefault(source, {})
+        for doc_id in set(entries) - set(chunk_ids):
+            self._remove(doc_id)
+            del entries[doc_id]
+
+    def remove_source(self, source):
+        for doc_id in self.sources.pop(source, {}):
+            self._remove(doc_id)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "sources": self.sources}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def search(self, query, k=3, filter=None):
+        """
+        Top `k` (Document, score) pairs for `query`; chunks sharing no term are
+        left out, and so are chunks whose metadata does not match `filter`
+        ({key: value}).
+        """
+        if not self._docs:
+            return []
+        count = len(self._docs)
+        average_length = self._total_length / count or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if filter and not _matches(self._docs[doc_id]["metadata"], filter):
+                    continue
+                length = self._docs[doc_id]["length"]
+                norm = self.k1 * (1.0 - self.b + self.b * length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            (Document(page_content=self._docs[doc_id]["text"], metadata=dict(self._docs[doc_id]["metadata"])), score)
+            for doc_id, score in ranked
+        ]
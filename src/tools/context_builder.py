@@ -0,0 +1,137 @@
+"""
+Token-budgeted legal context for the RAG prompt.
+
+Prompt tokens are the largest cost line and drive LLM latency, so instead of
+joining every retrieved chunk unconditionally the context is:
+
+1. deduplicated: the splitter repeats up to 100 characters between
+   neighbouring chunks, and the same chunk can come back twice;
+2. kept whole if it fits the budget (CONTEXT_TOKEN_BUDGET tokens);
+3. otherwise compressed extractively: the sentences sharing the most terms
+   with the complaint are kept, in their original order, until the budget is
+   reached.
+
+Tokens are counted with tiktoken (the encoding of the chat model). When its
+vocabulary cannot be loaded (offline), a characters-per-token estimate is used.
+"""
+import os
+import re
+import logging
+from functools import lru_cache
+
+from src.tools.arabic import tokenize
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "900"))
+TOKEN_ENCODING = "o200k_base"  # gpt-4o / gpt-4o-mini
+# Fallback estimate for Arabic legal text when tiktoken is unavailable
+CHARS_PER_TOKEN = 3
+# Overlaps shorter than this are coincidences, longer ones are the splitter's
+MIN_OVERLAP_CHARS = 30
+MAX_OVERLAP_CHARS = 300
+# Shorter "sentences" are dropped when compressing (page numbers, cut-off words)
+MIN_SENTENCE_TERMS = 3
+
+_SENTENCE_END = re.compile(r"(?<=[.!?؟؛])\s+|\n+")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as error:
+        logger.warning("tiktoken unavailable (%s): estimating %d characters per token", error, CHARS_PER_TOKEN)
+        return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _strip_overlap(previous, text):
+    """`text` without the prefix it shares with the end of `previous`."""
+    longest = min(len(previous), len(text), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:]
+    return text
+
+
+def dedupe_chunks(texts):
+    """Drop repeated chunks and the overlapping prefixes between chunks."""
+    kept = []
+    for text in texts:
+        text = text.strip()
+        if not text or any(text in other for other in kept):
+            continue
+        for other in kept:
+            text = _strip_overlap(other, text).strip()
+        if len(text) >= MIN_OVERLAP_CHARS:
+            kept.append(text)
+    return kept
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def build_context(docs, query, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Context text for `docs` within `budget` tokens, and stats
+    ({"tokens_in", "tokens_out", "saved"}) about what was cut.
+    """
+    raw = "\n\n".join(doc.page_content for doc in docs)
+    tokens_in = count_tokens(raw)
+    chunks = dedupe_chunks(doc.page_content for doc in docs)
+    text = "\n\n".join(chunks)
+    if count_tokens(text) > budget:
+        text = _extract(chunks, query, budget)
+    tokens_out = count_tokens(text)
+    stats = {"tokens_in": tokens_in, "tokens_out": tokens_out, "saved": tokens_in - tokens_out}
+    if stats["saved"]:
+        logger.info("RAG context: %d -> %d tokens (saved %d)", tokens_in, tokens_out, stats["saved"])
+    return text, stats
+
+
+def _extract(chunks, query, budget):
+    """Highest-overlap sentences first until the budget is spent, output in reading order."""
+    query_terms = set(tokenize(query))
+    sentences = []
+    seen = set()
+    for chunk_number, chunk in enumerate(chunks):
+        for sentence in split_sentences(chunk):
+            terms = set(tokenize(sentence))
+            # Duplicates, and fragments left by the chunk boundaries
+            if sentence in seen or len(terms) < MIN_SENTENCE_TERMS:
+                continue
+            seen.add(sentence)
+            overlap = len(query_terms & terms)
+            sentences.append({"chunk": chunk_number, "text": sentence, "score": overlap,
+                              "tokens": count_tokens(sentence)})
+
+    # Best first; among equals, earlier chunks (better retrieval rank) and earlier sentences
+    order = sorted(range(len(sentences)), key=lambda i: (-sentences[i]["score"], i))
+    selected = set()
+    spent = 0
+    for i in order:
+        # Separators: one token per sentence is a close enough allowance
+        cost = sentences[i]["tokens"] + 1
+        if spent + cost > budget:
+            continue
+        selected.add(i)
+        spent += cost
+
+    if not selected and sentences:
+        # Not even one sentence fits: keep the start of the best one
+        best = sentences[order[0]]["text"]
+        return best[:budget * CHARS_PER_TOKEN]
+
+    paragraphs = {}
+    for i in sorted(selected):
+        paragraphs.setdefault(sentences[i]["chunk"], []).append(sentences[i]["text"])
+    return "\n\n".join(" ".join(parts) for _, parts in sorted(paragraphs.items()))
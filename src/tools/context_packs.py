@@ -0,0 +1,158 @@
+"""
+Precomputed legal context per triage category ("context packs").
+
+Most complaints fall into a handful of categories, and the articles retrieved
+for "إنارة" are almost always the same. At the end of ingestion a ranked pack
+of the most relevant chunks is built for every sector and stored next to the
+vector DB, stamped with a fingerprint of the corpus (from the manifest).
+
+RAGAgent serves a pack when a BM25 check on the complaint (no embedding call)
+finds hits and none of them outside it, which takes retrieval off the hot
+path for the common case. A pack whose fingerprint no longer matches the
+manifest is ignored, and ingestion rebuilds the packs whenever the corpus
+changes. Both files are re-checked (modification time) whenever a pack is
+read, so a long-running app stops serving packs as soon as the corpus moves.
+"""
+import os
+import json
+import hashlib
+import threading
+
+from langchain_core.documents import Document
+
+from src.tools.sectors import SECTORS, sector_filter
+from src.tools.retriever import first_stage, with_k, with_filter
+
+CONTEXT_PACKS_PATH = "data/processed/context_packs.json"
+# Same file as src.ingestion.MANIFEST_PATH (not imported: ingestion pulls in pypdf/Chroma)
+MANIFEST_PATH = "data/processed/manifest.json"
+# Chunks kept per pack; RAGAgent re-ranks them locally and keeps DEFAULT_K
+PACK_SIZE = 8
+
+
+def corpus_fingerprint(manifest):
+    """Hash of every stored chunk id (and how it was chunked/tagged), in a stable order."""
+    digest = hashlib.sha256()
+    for source in sorted(manifest.get("sources", {})):
+        entry = manifest["sources"][source]
+        digest.update(f"{source}\x00{entry.get('chunking')}\x00{entry.get('sectors')}\x00".encode("utf-8"))
+        for chunk_id in sorted(entry.get("chunks", [])):
+            digest.update(chunk_id.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def read_manifest(manifest_path=MANIFEST_PATH):
+    """The ingestion manifest, or None if there is none yet."""
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def manifest_fingerprint(manifest_path=MANIFEST_PATH):
+    manifest = read_manifest(manifest_path)
+    return corpus_fingerprint(manifest) if manifest is not None else None
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def pack_query(sector):
+    return f"اختصاصات الجماعة في قطاع {SECTORS[sector]['categories'][0]}"
+
+
+def _chunk_key(doc):
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+class ContextPacks:
+    """
+    Packs read from `path`. With a `manifest_path` (serving), packs built for
+    another version of the corpus are never served, and both files are
+    re-read when they change on disk. Without one (ingestion), the packs are
+    taken as they are and only change through `build`.
+    """
+
+    def __init__(self, path=CONTEXT_PACKS_PATH, manifest_path=MANIFEST_PATH):
+        self.path = path
+        self.manifest_path = manifest_path
+        self.fingerprint = None
+        self.packs = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def _load(self):
+        self.fingerprint = None
+        self.packs = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.fingerprint = data.get("fingerprint")
+            self.packs = data.get("packs", {})
+        if self.manifest_path is not None and self.fingerprint != manifest_fingerprint(self.manifest_path):
+            self.packs = {}
+
+    def _refresh(self):
+        stamp = (_mtime(self.path), _mtime(self.manifest_path) if self.manifest_path is not None else None)
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp != self._stamp:
+                self._load()
+                self._stamp = stamp
+
+    def _pack(self, sector):
+        if self.manifest_path is not None:
+            self._refresh()
+        return self.packs.get(sector) if sector else None
+
+    def __len__(self):
+        return len(self.packs)
+
+    def is_current(self, fingerprint):
+        return bool(self.packs) and self.fingerprint == fingerprint
+
+    def get(self, sector):
+        """Ranked Documents of the pack of `sector` (empty if there is none)."""
+        pack = self._pack(sector)
+        if not pack:
+            return []
+        return [Document(page_content=item["text"], metadata=dict(item["metadata"])) for item in pack["docs"]]
+
+    def chunk_ids(self, sector):
+        pack = self._pack(sector)
+        return {item["metadata"].get("chunk_id") or item["text"] for item in (pack or {}).get("docs", [])}
+
+    def build(self, retriever, fingerprint, size=PACK_SIZE):
+        """
+        Fill one pack per sector: chunks of the sector first (metadata filter),
+        completed from the whole index. `retriever` is any retriever mode.
+        """
+        # Candidates only: the packs are re-ranked per complaint when served
+        wide = with_k(first_stage(retriever), size)
+        packs = {}
+        for sector in SECTORS:
+            if sector == "other":
+                continue
+            query = pack_query(sector)
+            docs = {}
+            for doc in with_filter(wide, sector_filter(sector)).invoke(query) + wide.invoke(query):
+                docs.setdefault(_chunk_key(doc), doc)
+            packs[sector] = {
+                "query": query,
+                "docs": [{"text": doc.page_content, "metadata": doc.metadata} for doc in list(docs.values())[:size]],
+            }
+        self.packs = packs
+        self.fingerprint = fingerprint
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "fingerprint": self.fingerprint, "packs": self.packs}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,164 @@
+"""
+Persistent embedding cache shared by ingestion and retrieval.
+
+`CachedEmbeddings` wraps any LangChain embeddings object. Vectors are keyed by
+the SHA-256 of the text and namespaced by the embedding model name, so switching
+models never mixes vectors. They are stored as raw float32 bytes in SQLite,
+which is about 4x smaller than JSON floats and needs no parsing. The least
+recently used vectors are evicted past `max_entries`.
+
+A re-ingestion of an unchanged PDF therefore costs no embedding call, and a
+repeated RAG query is answered locally.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/cache/embeddings.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") not in ("0", "false", "False")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    namespace TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, text_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_accessed ON embeddings(accessed_at);
+"""
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _to_blob(vector):
+    return array("f", vector).tobytes()
+
+
+def _from_blob(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying, namespace, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _lookup(self, hashes):
+        connection = self._connection()
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _LOOKUP_CHUNK):
+            chunk = unique[start:start + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE namespace = ? AND text_hash IN ({placeholders})",
+                (self.namespace, *chunk)
+            ).fetchall()
+            for text_hash, blob in rows:
+                found[text_hash] = _from_blob(blob)
+            if rows:
+                connection.execute(
+                    f"UPDATE embeddings SET accessed_at = ? WHERE namespace = ? AND text_hash IN ({placeholders})",
+                    (time.time(), self.namespace, *chunk)
+                )
+        return found
+
+    def _store(self, pairs):
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (namespace, text_hash, vector, accessed_at) VALUES (?, ?, ?, ?)",
+                [(self.namespace, text_hash, _to_blob(vector), now) for text_hash, vector in pairs]
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._evict(connection)
+
+    def _evict(self, connection):
+        (count,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def _missing(self, texts):
+        hashes = [_text_hash(text) for text in texts]
+        found = self._lookup(hashes)
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found:
+                missing.setdefault(text_hash, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return hashes, found, missing
+
+    def embed_documents(self, texts):
+        hashes, found, missing = self._missing(texts)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new = list(zip(missing.keys(), vectors))
+            self._store(new)
+            found.update(new)
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        hashes, found, missing = self._missing(texts)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            new = list(zip(missing.keys(), vectors))
+            self._store(new)
+            found.update(new)
+        return [found[text_hash] for text_hash in hashes]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
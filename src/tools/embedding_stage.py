@@ -0,0 +1,125 @@
+"""
+Batched, rate-aware embedding stage used by ingestion.
+
+Instead of leaving batching to Chroma.from_documents, chunks are embedded in
+batches of `batch_size` with at most `max_parallel` requests in flight, under
+two token buckets (requests per minute and tokens per minute) sized for the
+OpenRouter limits. 429 and 5xx responses, connection errors and timeouts are
+retried with exponential backoff and jitter, honouring Retry-After when the
+provider sends it.
+
+Batches are yielded as soon as they are embedded so the caller can store them
+and checkpoint progress batch by batch.
+"""
+import os
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.tools.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_PARALLEL = int(os.getenv("EMBED_MAX_PARALLEL", "4"))
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", "300"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text):
+    # Arabic legal text runs at roughly 3 characters per token with cl100k
+    return len(text) // 3 + 1
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error):
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Connection errors and timeouts carry no status code
+    name = type(error).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "TimeoutException")
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class EmbeddingStage:
+    def __init__(self, embeddings, batch_size=EMBED_BATCH_SIZE, max_parallel=EMBED_MAX_PARALLEL,
+                 requests_per_minute=EMBED_REQUESTS_PER_MINUTE, tokens_per_minute=EMBED_TOKENS_PER_MINUTE,
+                 max_retries=EMBED_MAX_RETRIES, base_delay=1.0, max_delay=60.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_parallel = max_parallel
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests = TokenBucket.per_minute(requests_per_minute)
+        self.tokens = TokenBucket.per_minute(tokens_per_minute, burst=tokens_per_minute / 6)
+        self.retries = 0
+
+    def _embed_with_retry(self, texts):
+        attempt = 0
+        while True:
+            self.requests.acquire()
+            self.tokens.acquire(sum(estimate_tokens(text) for text in texts))
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is not None:
+                    # Everybody waits, not just this worker
+                    self.requests.penalize(delay)
+                else:
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                self.retries += 1
+                logger.warning("Embedding batch failed (%s), retry %d in %.1fs", e, attempt, delay)
+                time.sleep(delay)
+
+    def embed_batches(self, batches):
+        """
+        Embed an iterable of batches of (id, Document) pairs.
+
+        Yields (batch, vectors) in completion order. At most 2 * max_parallel
+        batches are read ahead, so the input can be an unbounded generator.
+        """
+        batches = iter(batches)
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="embed") as executor:
+            pending = {}
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < 2 * self.max_parallel:
+                    try:
+                        batch = next(batches)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    texts = [doc.page_content for _, doc in batch]
+                    pending[executor.submit(self._embed_with_retry, texts)] = batch
+
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = pending.pop(future)
+                    yield batch, future.result()
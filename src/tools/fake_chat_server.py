@@ -0,0 +1,108 @@
+"""
+Local fake of the OpenAI/OpenRouter chat completions endpoint, for testing the
+model router offline (latency budgets, escalation, stats).
+
+    python -m src.tools.fake_chat_server --port 8766 \\
+        --latency openai/gpt-4o=2.0 --invalid openai/gpt-4o-mini
+    MODEL_ROUTER_BASE_URL=http://127.0.0.1:8766/v1 python -m src.main --batch complaints.jsonl
+
+Every model answers the same JSON object (valid for the triage, fused and RAG
+prompts) after its configured latency; models listed with `--invalid` answer
+text that is not JSON. Streaming requests get the answer as one SSE chunk,
+followed by a usage chunk when they ask for it (`stream_options.include_usage`).
+"""
+import json
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_ANSWER = {
+    "category": "إنارة",
+    "summary_ar": "انطفاء الإنارة العمومية في الحي",
+    "urgency": "Medium",
+    "original_language": "الدارجة المغربية",
+    "legal_advice": "1. المادة 83. 2. اختصاص ذاتي للجماعة. 3. إصلاح الإنارة.",
+    "report": "### 📋 RAPPORT DÉCISIONNEL",
+}
+INVALID_ANSWER = "Désolé, je ne peux pas répondre en JSON."
+
+
+def _usage(request, content):
+    # Rough token counts, enough for the router's cost estimate
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in request.get("messages", []))
+    return {"prompt_tokens": prompt_chars // 3, "completion_tokens": len(content) // 3,
+            "total_tokens": (prompt_chars + len(content)) // 3}
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    latencies = {}
+    invalid_models = set()
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, model, content, usage=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        chunks = [{
+            "id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }]
+        if usage is not None:
+            chunks.append({"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                           "model": model, "choices": [], "usage": usage})
+        events = "".join(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n" for chunk in chunks)
+        self.wfile.write(f"{events}data: [DONE]\n\n".encode("utf-8"))
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "fake")
+        time.sleep(self.latencies.get(model, 0.0))
+
+        content = INVALID_ANSWER if model in self.invalid_models else json.dumps(FAKE_ANSWER, ensure_ascii=False)
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage")
+            self._stream(model, content, _usage(request, content) if include_usage else None)
+            return
+        self._send(200, {
+            "id": "fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(request, content),
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=8766, latencies=None, invalid_models=()):
+    FakeChatHandler.latencies = dict(latencies or {})
+    FakeChatHandler.invalid_models = set(invalid_models)
+    server = ThreadingHTTPServer((host, port), FakeChatHandler)
+    print(f"Fake chat endpoint: http://{host}:{server.server_port}/v1")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake chat completions endpoint for offline model routing tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="latency of a model (repeatable)")
+    parser.add_argument("--invalid", action="append", default=[], metavar="MODEL",
+                        help="model that answers non-JSON text (repeatable)")
+    args = parser.parse_args()
+    latencies = {model: float(seconds) for model, seconds in (item.rsplit("=", 1) for item in args.latency)}
+    serve(args.host, args.port, latencies, args.invalid).serve_forever()
@@ -0,0 +1,92 @@
+"""
+Local fake of the OpenAI/OpenRouter embeddings endpoint, for testing ingestion
+offline (batching, rate limiting, retries, checkpoint/resume).
+
+    python -m src.tools.fake_embeddings_server --port 8765 --fail-rate 0.2
+    OPENROUTER_BASE_URL=http://127.0.0.1:8765/v1 python -m src.ingestion
+
+Vectors are deterministic (seeded by the input), and `--fail-rate` answers that
+fraction of requests with a 429 (with Retry-After) or a 503.
+"""
+import json
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_vector(item, dimensions):
+    seed = hashlib.sha256(json.dumps(item, ensure_ascii=False).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    dimensions = 1536
+    fail_rate = 0.0
+    requests_served = 0
+    _lock = threading.Lock()
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        with self._lock:
+            type(self).requests_served += 1
+        if random.random() < self.fail_rate:
+            if random.random() < 0.5:
+                self._send(429, {"error": {"message": "rate limited"}}, {"Retry-After": "1"})
+            else:
+                self._send(503, {"error": {"message": "upstream unavailable"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        inputs = request.get("input", [])
+        # A single string, a list of strings or a list of token-id lists
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = request.get("dimensions") or self.dimensions
+        self._send(200, {
+            "object": "list",
+            "model": request.get("model", "fake"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_vector(item, dimensions)}
+                for i, item in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=8765, dimensions=1536, fail_rate=0.0):
+    FakeEmbeddingsHandler.dimensions = dimensions
+    FakeEmbeddingsHandler.fail_rate = fail_rate
+    server = ThreadingHTTPServer((host, port), FakeEmbeddingsHandler)
+    print(f"Fake embeddings endpoint: http://{host}:{server.server_port}/v1")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake embeddings endpoint for offline ingestion tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered 429/503")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.dimensions, args.fail_rate).serve_forever()
@@ -0,0 +1,304 @@
+"""
+Memory-mapped flat vector index, an optional alternative to Chroma.
+
+For a corpus of a few thousand chunks, opening the Chroma persistent client
+costs more (startup time, RSS) than the search itself. This backend keeps:
+
+    <directory>/vectors.npy   normalized embeddings, float32 or float16 (N x dim)
+    <directory>/meta.json     ids, texts and metadatas, in the same row order
+
+The matrix is opened with np.load(mmap_mode="r"): nothing is copied into the
+process, and several workers share the same pages through the OS page cache.
+Search is an exact top-k over vectorized dot products (cosine similarity).
+
+With `quantized=True` (VECTOR_BACKEND=flat_int8) the first pass scans an int8
+copy instead (one scale per vector, 4x smaller than float32), and only the best
+`rerank_factor * k` candidates are re-scored exactly from the full-precision
+matrix, which stays on disk and is only paged in for those rows:
+
+    <directory>/vectors_int8.npy   round(v / scale), int8 (N x dim)
+    <directory>/scales.npy         max(|v|) / 127 per vector, float32 (N)
+
+    python -m src.tools.flat_index --recall    # recall of int8 vs exact search
+
+It is exported from the Chroma collection at the end of ingestion and selected
+with VECTOR_BACKEND=flat or flat_int8 (see retriever.get_vectorstore).
+"""
+import os
+import json
+import math
+import time
+import shutil
+import argparse
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+FLAT_INDEX_DIRECTORY = "data/processed/flat_index"
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32")
+# Rows scored per block (float16/int8 matrices): the float32 copy of a block stays in cache
+SCAN_BLOCK_ROWS = 2048
+# Rows read from Chroma per page while exporting
+EXPORT_PAGE_SIZE = 1000
+
+# Candidates re-scored exactly per requested result, in quantized mode
+RERANK_FACTOR = int(os.getenv("FLAT_INDEX_RERANK_FACTOR", "4"))
+
+VECTORS_FILE = "vectors.npy"
+INT8_FILE = "vectors_int8.npy"
+SCALES_FILE = "scales.npy"
+META_FILE = "meta.json"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize_int8(matrix):
+    """Symmetric scalar quantization with one scale per row: matrix ~= codes * scales[:, None]."""
+    scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0, dtype=np.float32)
+    scales = scales.astype(np.float32)
+    safe = np.where(scales == 0, 1.0, scales)
+    codes = np.clip(np.rint(matrix / safe[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def _matches(metadata, where):
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+def top_k(scores, k):
+    """Indices of the `k` highest scores, best first (argpartition, no full sort)."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class FlatVectorStore(VectorStore):
+    def __init__(self, directory=FLAT_INDEX_DIRECTORY, embedding=None, quantized=False, rerank_factor=RERANK_FACTOR):
+        self.directory = directory
+        self.embedding = embedding
+        self.quantized = quantized
+        self.rerank_factor = rerank_factor
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.texts = meta["texts"]
+        self.metadatas = meta["metadatas"]
+        self.matrix = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        self.codes = self.scales = None
+        if quantized:
+            self.codes = np.load(os.path.join(directory, INT8_FILE), mmap_mode="r")
+            self.scales = np.load(os.path.join(directory, SCALES_FILE))
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def exists(directory=FLAT_INDEX_DIRECTORY):
+        return all(os.path.exists(os.path.join(directory, name))
+                   for name in (META_FILE, VECTORS_FILE, INT8_FILE, SCALES_FILE))
+
+    @staticmethod
+    def stored_dtype(directory=FLAT_INDEX_DIRECTORY):
+        """dtype of the index in `directory` (read from the .npy header only), or None."""
+        path = os.path.join(directory, VECTORS_FILE)
+        if not os.path.exists(path):
+            return None
+        return str(np.load(path, mmap_mode="r").dtype)
+
+    # --- Build -----------------------------------------------------------
+
+    @staticmethod
+    def write(directory, ids, vectors, texts, metadatas, dtype=FLAT_INDEX_DTYPE):
+        """
+        Write a new index and swap it in place of `directory`.
+
+        The files go to a sibling folder first, which then replaces the old
+        one: processes that still map the old matrix keep reading it safely.
+        """
+        tmp_directory = directory.rstrip("/") + ".tmp"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        if isinstance(vectors, np.ndarray):
+            matrix = vectors
+        else:
+            matrix = np.asarray(vectors, dtype=np.float32)
+        matrix = _normalize_rows(matrix.astype(np.float32))
+        np.save(os.path.join(tmp_directory, VECTORS_FILE), matrix.astype(dtype))
+        codes, scales = quantize_int8(matrix)
+        np.save(os.path.join(tmp_directory, INT8_FILE), codes)
+        np.save(os.path.join(tmp_directory, SCALES_FILE), scales)
+        with open(os.path.join(tmp_directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "dtype": dtype, "ids": list(ids), "texts": list(texts),
+                       "metadatas": list(metadatas)}, f, ensure_ascii=False)
+        old_directory = directory.rstrip("/") + ".old"
+        shutil.rmtree(old_directory, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, old_directory)
+        os.replace(tmp_directory, directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+
+    @classmethod
+    def export_from_chroma(cls, collection, directory=FLAT_INDEX_DIRECTORY, dtype=FLAT_INDEX_DTYPE,
+                           page_size=EXPORT_PAGE_SIZE):
+        """Copy a Chroma collection (embeddings, documents, metadatas) into a flat index."""
+        count = collection.count()
+        ids, texts, metadatas = [], [], []
+        matrix = None
+        for offset in range(0, count, page_size):
+            page = collection.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            if matrix is None:
+                matrix = np.empty((count, vectors.shape[1]), dtype=np.float32)
+            matrix[len(ids):len(ids) + len(vectors)] = vectors
+            ids.extend(page["ids"])
+            texts.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+        if matrix is None:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        cls.write(directory, ids, matrix[:len(ids)], texts, metadatas, dtype=dtype)
+        return len(ids)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory=FLAT_INDEX_DIRECTORY, **kwargs):
+        texts = list(texts)
+        vectors = embedding.embed_documents(texts)
+        ids = ids or [str(i) for i in range(len(texts))]
+        cls.write(directory, ids, vectors, texts, metadatas or [{} for _ in texts], **kwargs)
+        return cls(directory, embedding)
+
+    # --- Search ----------------------------------------------------------
+
+    @staticmethod
+    def _query(vector):
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    @staticmethod
+    def _scan(matrix, query):
+        if matrix.dtype == np.float32:
+            return np.asarray(matrix @ query)
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), SCAN_BLOCK_ROWS):
+            block = matrix[start:start + SCAN_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+    def _mask(self, filter):
+        return np.fromiter((_matches(metadata or {}, filter) for metadata in self.metadatas),
+                           dtype=bool, count=len(self.metadatas))
+
+    def search_rows(self, vector, k=4, filter=None, quantized=None, rerank_factor=None):
+        """
+        (row, cosine) pairs of the top `k` rows.
+
+        Exact scan of the full-precision matrix, or, in quantized mode, an int8
+        scan followed by an exact re-score of the best `rerank_factor * k` rows.
+        """
+        quantized = self.quantized if quantized is None else quantized
+        rerank_factor = rerank_factor or self.rerank_factor
+        query = self._query(vector)
+        if quantized:
+            scores = self._scan(self.codes, query) * self.scales
+        else:
+            scores = self._scan(self.matrix, query)
+        if filter:
+            scores = np.where(self._mask(filter), scores, -np.inf)
+        candidates = [row for row in top_k(scores, k * rerank_factor if quantized else k) if np.isfinite(scores[row])]
+        if not quantized or not candidates:
+            return [(int(row), float(scores[row])) for row in candidates]
+        candidates = np.sort(np.asarray(candidates))
+        exact = np.asarray(self.matrix[candidates], dtype=np.float32) @ query
+        return [(int(candidates[i]), float(exact[i])) for i in top_k(exact, k)]
+
+    def _document(self, row):
+        return Document(page_content=self.texts[row], metadata=dict(self.metadatas[row] or {}))
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None, **kwargs):
+        """Exact top-k by cosine similarity; `filter` is a {key: value} metadata match."""
+        if not len(self.ids):
+            return []
+        return [(self._document(row), score) for row, score in self.search_rows(embedding, k, filter)]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter)
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        vector = await self.embedding.aembed_query(query)
+        return self.similarity_search_by_vector_with_score(vector, k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    async def asimilarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity -> the relevance LangChain's Chroma reports for unit
+        # vectors (squared L2 distance 2 - 2cos, then 1 - d / sqrt(2)), so
+        # relevance thresholds mean the same thing on both backends
+        return lambda score: 1.0 - (2.0 - 2.0 * score) / math.sqrt(2.0)
+
+
+def recall_report(store, k=3, rerank_factors=(1, 2, 4, 8), sample=200, seed=0):
+    """
+    Recall@k of the int8 search against the exact float search.
+
+    The queries are stored chunk vectors (with the chunk itself excluded from
+    both result lists), so no embedding call is needed.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(store), size=min(sample, len(store)), replace=False)
+    queries = np.asarray(store.matrix[np.sort(rows)], dtype=np.float32)
+
+    def run(**kwargs):
+        results = []
+        started = time.perf_counter()
+        for row, query in zip(np.sort(rows), queries):
+            hits = store.search_rows(query, k + 1, **kwargs)
+            results.append(set([hit for hit, _ in hits if hit != row][:k]))
+        return results, (time.perf_counter() - started) * 1000 / len(queries)
+
+    exact, exact_ms = run(quantized=False)
+    report = [{"mode": "exact", "rerank_factor": None, "recall": 1.0, "ms_per_query": round(exact_ms, 3)}]
+    for factor in rerank_factors:
+        approx, approx_ms = run(quantized=True, rerank_factor=factor)
+        hits = sum(len(a & e) for a, e in zip(approx, exact))
+        total = sum(len(e) for e in exact) or 1
+        report.append({"mode": "int8", "rerank_factor": factor, "recall": round(hits / total, 4),
+                       "ms_per_query": round(approx_ms, 3)})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index vectoriel mmap : rapport de rappel int8 vs recherche exacte")
+    parser.add_argument("--directory", default=FLAT_INDEX_DIRECTORY, help="dossier de l'index")
+    parser.add_argument("--recall", action="store_true", help="mesurer le rappel de la recherche int8")
+    parser.add_argument("--k", type=int, default=3, help="nombre de résultats par requête")
+    parser.add_argument("--factors", default="1,2,4,8", help="facteurs de re-ranking à comparer")
+    parser.add_argument("--sample", type=int, default=200, help="nombre de requêtes (vecteurs de l'index)")
+    args = parser.parse_args()
+
+    store = FlatVectorStore(args.directory, quantized=True)
+    full_mb = store.matrix.nbytes / 1e6
+    int8_mb = (store.codes.nbytes + store.scales.nbytes) / 1e6
+    print(f"{len(store)} vecteurs, dim {store.matrix.shape[1] if len(store) else 0} : "
+          f"{store.matrix.dtype} {full_mb:.1f} Mo, int8 {int8_mb:.1f} Mo")
+    if args.recall:
+        factors = [int(factor) for factor in args.factors.split(",")]
+        for line in recall_report(store, args.k, factors, args.sample):
+            print(f"{line['mode']:>6}  rerank x{line['rerank_factor'] or '-'}  "
+                  f"recall@{args.k} {line['recall']:.4f}  {line['ms_per_query']} ms/requête")
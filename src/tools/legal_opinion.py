@@ -0,0 +1,57 @@
+"""
+Structured fields of the RAG agent's legal opinion.
+
+The legal advice is free Arabic text answering three points (article,
+competence type, proposed action). The report template needs them as
+fields. They are read back from the text here, without an LLM call: article
+numbers through `find_article_references`, the competence type and the action
+through the wording and numbering the RAG prompt asks for. An opinion that
+cites no article gets none: the report then asks the legal service to
+confirm it rather than guessing from the retrieved chunks.
+"""
+import re
+
+from src.tools.arabic import normalize
+from src.tools.articles import find_article_references
+
+# Competence types of loi 113.14 (ذاتية / مشتركة / منقولة), matched on normalized text
+COMPETENCE_PATTERNS = {
+    "ذاتي": re.compile(r"ذاتي"),
+    "مشترك": re.compile(r"مشترك"),
+    "منقول": re.compile(r"منقول"),
+}
+
+# Point 3 of the opinion ("3. مقترح للإجراء ...") up to point 4 or the end
+_ACTION = re.compile(r"^[\s*#]*(?:3|٣)\s*[.)\-:]\s*(?P<action>.+?)(?=^[\s*#]*(?:4|٤)\s*[.)\-:]|\Z)", re.M | re.S)
+_LABEL = re.compile(r"^[^:：\n]{0,60}[:：]\s*")
+
+
+def extract_competence(text):
+    """
+    Competence type named in `text`, or None if there is none or several.
+
+    An opinion naming two types ("ذاتي أم مشترك؟ ... مشترك", "ليس ذاتياً بل
+    مشترك") cannot be read without understanding it: the report then leaves
+    the competence to the legal service rather than guessing.
+    """
+    normalized = normalize(text or "")
+    found = [name for name, pattern in COMPETENCE_PATTERNS.items() if pattern.search(normalized)]
+    return found[0] if len(found) == 1 else None
+
+
+def extract_action(text):
+    match = _ACTION.search(text or "")
+    if not match:
+        return ""
+    action = _LABEL.sub("", match.group("action").replace("**", "").strip(), count=1)
+    return " ".join(action.split())
+
+
+def legal_opinion(advice):
+    """{"articles", "competence", "action", "advice"} from the opinion text."""
+    return {
+        "articles": find_article_references(advice),
+        "competence": extract_competence(advice),
+        "action": extract_action(advice),
+        "advice": advice or "",
+    }
@@ -0,0 +1,177 @@
+"""
+Persistent LLM response cache shared by the three agents.
+
+Identical complaints (ten neighbours reporting the same streetlight) used to be
+sent to the model once per agent each time. This is a LangChain `BaseCache`
+backed by a local SQLite file, so every agent chain, Streamlit session and
+worker process on the host shares the same answers.
+
+Entries are keyed by the agent namespace (agent name + prompt-template
+version), the LangChain llm_string (model, temperature and other call params)
+and the fully rendered prompt. They expire after a TTL and the least recently
+used ones are evicted past `max_entries`. Hit/miss counters live in the same
+database so they add up across processes.
+
+LangChain only consults the cache on invoke/ainvoke; the streaming calls used
+by the dashboard go straight to the model.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/cache/llm_cache.sqlite")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at);
+CREATE TABLE IF NOT EXISTS llm_cache_stats (
+    namespace TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class SQLiteLLMCache(BaseCache):
+    """SQLite-backed LangChain cache with TTL, LRU eviction and hit/miss counters."""
+
+    def __init__(self, path=LLM_CACHE_PATH, namespace="default",
+                 ttl_seconds=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # WAL lets readers in other processes proceed while one process writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _key(self, prompt, llm_string):
+        raw = "\x00".join((self.namespace, llm_string, prompt))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _count(self, column):
+        self._connection().execute(
+            f"INSERT INTO llm_cache_stats (namespace, {column}) VALUES (?, 1) "
+            f"ON CONFLICT(namespace) DO UPDATE SET {column} = {column} + 1",
+            (self.namespace,)
+        )
+
+    def lookup(self, prompt, llm_string):
+        key = self._key(prompt, llm_string)
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+            if row is not None:
+                connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._count("misses")
+            return None
+        connection.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return [Generation(text=text) for text in json.loads(row[0])]
+
+    def update(self, prompt, llm_string, return_val):
+        now = time.time()
+        value = json.dumps([generation.text for generation in return_val], ensure_ascii=False)
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, namespace, value, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (self._key(prompt, llm_string), self.namespace, value, now, now)
+        )
+        self._evict(connection, now)
+
+    def _evict(self, connection, now):
+        if self.ttl_seconds:
+            connection.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        (count,) = connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            connection.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def clear(self, **kwargs):
+        """Drop this namespace's entries (or every entry with clear(all_namespaces=True))."""
+        connection = self._connection()
+        if kwargs.get("all_namespaces"):
+            connection.execute("DELETE FROM llm_cache")
+            connection.execute("DELETE FROM llm_cache_stats")
+        else:
+            connection.execute("DELETE FROM llm_cache WHERE namespace = ?", (self.namespace,))
+            connection.execute("DELETE FROM llm_cache_stats WHERE namespace = ?", (self.namespace,))
+
+    def stats(self):
+        """Hit/miss counters and entry counts per namespace, across all processes."""
+        connection = self._connection()
+        entries = dict(connection.execute(
+            "SELECT namespace, COUNT(*) FROM llm_cache GROUP BY namespace"
+        ).fetchall())
+        report = {}
+        for namespace, hits, misses in connection.execute(
+            "SELECT namespace, hits, misses FROM llm_cache_stats ORDER BY namespace"
+        ):
+            total = hits + misses
+            report[namespace] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+                "entries": entries.get(namespace, 0),
+            }
+        return report
+
+
+def get_llm_cache(agent_name, prompt_version):
+    """
+    Cache for one agent's chain, or None when LLM_CACHE_ENABLED=0.
+
+    Bumping an agent's PROMPT_VERSION moves it to a fresh namespace, so answers
+    produced by an older prompt template are never served.
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+    return SQLiteLLMCache(namespace=f"{agent_name}@v{prompt_version}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    cache = SQLiteLLMCache(namespace="cli")
+    if sys.argv[1:] == ["clear"]:
+        cache.clear(all_namespaces=True)
+        print(f"✅ Cache vidé : {LLM_CACHE_PATH}")
+    else:
+        for namespace, counters in cache.stats().items():
+            print(f"{namespace}: {counters}")
@@ -0,0 +1,362 @@
+"""
+Per-agent model routing from a policy and observed latency/price.
+
+Every agent used to hardcode openai/gpt-4o-mini. Each agent now asks the
+router which model to call:
+
+- the policy (ROUTING_POLICY, or the JSON file in MODEL_ROUTING_POLICY) lists
+  the candidate models of each agent in order of preference, with an optional
+  latency budget (`max_p95_s`) and cost budget per call (`max_cost_usd`);
+- the first candidate whose observed p95 latency and estimated cost (average
+  tokens of its last calls x MODEL_PRICES) fit the budgets is used; models
+  with fewer than MIN_SAMPLES calls are trusted until measured. If none fits,
+  the one with the lowest p95 is used;
+- when the answer cannot be parsed or validated (any ValueError, which
+  includes OutputParserException and pydantic's ValidationError), or is
+  flagged LowConfidence, the call is retried on the `escalate` models.
+
+Latencies and token counts come from a LangChain callback on every real call
+(cache hits are not counted) and are kept in a SQLite file next to the LLM
+cache, so every process on the host learns from the same measurements:
+
+    python -m src.tools.model_router            # stats and current routes
+
+For offline tests, point MODEL_ROUTER_BASE_URL at src/tools/fake_chat_server.py.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+MODEL_ROUTER_BASE_URL = os.getenv("MODEL_ROUTER_BASE_URL", "")
+MODEL_ROUTING_POLICY = os.getenv("MODEL_ROUTING_POLICY", "")
+MODEL_STATS_PATH = os.getenv("MODEL_STATS_PATH", "data/cache/model_stats.sqlite")
+MODEL_STATS_ENABLED = os.getenv("MODEL_STATS_ENABLED", "1") not in ("0", "false", "False")
+# Percentiles are computed over the last STATS_WINDOW calls of an (agent, model)
+STATS_WINDOW = 200
+MIN_SAMPLES = 20
+
+# USD per million tokens (input, output), OpenRouter list prices; override in the policy file
+MODEL_PRICES = {
+    "openai/gpt-4o-mini": (0.15, 0.60),
+    "openai/gpt-4o": (2.50, 10.00),
+    "anthropic/claude-3.5-sonnet": (3.00, 15.00),
+    "anthropic/claude-3.5-haiku": (0.80, 4.00),
+}
+
+# Triage: cheap and fast, escalated to a stronger model on invalid JSON or an
+# unknown category. Legal reasoning: the stronger model while it stays in budget.
+ROUTING_POLICY = {
+    "triage": {"models": ["openai/gpt-4o-mini"], "escalate": ["openai/gpt-4o"], "max_p95_s": 5.0},
+    "rag": {"models": ["openai/gpt-4o", "openai/gpt-4o-mini"], "max_p95_s": 15.0, "max_cost_usd": 0.01},
+    "reporter": {"models": ["openai/gpt-4o-mini"], "escalate": ["openai/gpt-4o"]},
+    "fused": {"models": ["openai/gpt-4o-mini"], "escalate": ["openai/gpt-4o"], "max_p95_s": 10.0},
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS model_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    agent TEXT NOT NULL,
+    model TEXT NOT NULL,
+    latency_s REAL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_model_calls_route ON model_calls(agent, model, id);
+"""
+
+
+def clean_env_var(value):
+    """Remove all non-printable characters from a string."""
+    if not value:
+        return ""
+    return re.sub(r'[\x00-\x1f\x7f-\x9f]', '', value).strip()
+
+
+class LowConfidence(ValueError):
+    """A valid answer the caller does not trust; kept if no stronger model is left."""
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class ModelStats:
+    """Per-call latency/tokens/errors of each (agent, model), in SQLite."""
+
+    def __init__(self, path=MODEL_STATS_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def record(self, agent, model, latency_s=None, input_tokens=0, output_tokens=0, error=None):
+        self._connection().execute(
+            "INSERT INTO model_calls (agent, model, latency_s, input_tokens, output_tokens, error, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (agent, model, latency_s, input_tokens or 0, output_tokens or 0, error, time.time())
+        )
+
+    def summary(self, agent, model, window=STATS_WINDOW):
+        """{"calls", "p50_s", "p95_s", "error_rate", "input_tokens", "output_tokens"} of the last calls."""
+        rows = self._connection().execute(
+            "SELECT latency_s, input_tokens, output_tokens, error FROM model_calls"
+            " WHERE agent = ? AND model = ? ORDER BY id DESC LIMIT ?",
+            (agent, model, window)
+        ).fetchall()
+        timed = [row for row in rows if row[0] is not None and row[3] is None]
+        latencies = sorted(row[0] for row in timed)
+        # Calls whose provider reported no usage would drag the cost estimate down
+        counted = [row for row in timed if row[1] or row[2]]
+        return {
+            "calls": len(rows),
+            "p50_s": round(_percentile(latencies, 0.5), 3) if latencies else None,
+            "p95_s": round(_percentile(latencies, 0.95), 3) if latencies else None,
+            "error_rate": round(sum(row[3] is not None for row in rows) / len(rows), 3) if rows else 0.0,
+            "input_tokens": sum(row[1] for row in counted) / len(counted) if counted else 0,
+            "output_tokens": sum(row[2] for row in counted) / len(counted) if counted else 0,
+        }
+
+    def routes(self):
+        return self._connection().execute("SELECT DISTINCT agent, model FROM model_calls ORDER BY agent, model").fetchall()
+
+
+class _StatsCallback(BaseCallbackHandler):
+    """Times every real model call of one (agent, model) and records it in ModelStats."""
+
+    def __init__(self, stats, agent, model):
+        self.stats = stats
+        self.agent = agent
+        self.model = model
+        self._started = {}
+        self._streamed = set()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        self._streamed.add(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        streamed = run_id in self._streamed
+        self._streamed.discard(run_id)
+        usage = (response.llm_output or {}).get("token_usage")
+        # No token_usage and no streamed token: the answer came from the LLM cache
+        if started is None or (usage is None and not streamed):
+            return
+        usage = usage or {}
+        if not usage and response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            metadata = getattr(message, "usage_metadata", None) or {}
+            usage = {"prompt_tokens": metadata.get("input_tokens", 0), "completion_tokens": metadata.get("output_tokens", 0)}
+        try:
+            self.stats.record(self.agent, self.model, time.perf_counter() - started,
+                              usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        except sqlite3.Error as e:
+            logger.warning("Could not record model stats: %s", e)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._streamed.discard(run_id)
+        if self._started.pop(run_id, None) is None:
+            return
+        try:
+            self.stats.record(self.agent, self.model, error=type(error).__name__)
+        except sqlite3.Error as e:
+            logger.warning("Could not record model stats: %s", e)
+
+
+def load_policy(path=MODEL_ROUTING_POLICY):
+    """ROUTING_POLICY and MODEL_PRICES, updated per agent / model from the JSON file at `path`."""
+    policy = {agent: dict(entry) for agent, entry in ROUTING_POLICY.items()}
+    prices = dict(MODEL_PRICES)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+        for agent, entry in overrides.get("agents", {}).items():
+            policy.setdefault(agent, {}).update(entry)
+        prices.update({model: tuple(price) for model, price in overrides.get("prices", {}).items()})
+    return policy, prices
+
+
+class ModelRouter:
+    def __init__(self, policy=None, prices=None, stats=None, base_url=None, api_key=None):
+        if policy is None:
+            policy, default_prices = load_policy()
+            prices = prices if prices is not None else default_prices
+        self.policy = policy
+        self.prices = prices if prices is not None else dict(MODEL_PRICES)
+        if stats is None and MODEL_STATS_ENABLED:
+            stats = ModelStats()
+        self.stats = stats
+        self.base_url = base_url or MODEL_ROUTER_BASE_URL
+        self.api_key = api_key
+        self._llms = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, agent):
+        entry = self.policy.get(agent)
+        if not entry or not entry.get("models"):
+            raise ValueError(f"No models configured for agent {agent!r}")
+        return entry
+
+    def estimated_cost(self, model, summary):
+        """Expected USD per call from the average tokens of the last calls, or None."""
+        price = self.prices.get(model)
+        if price is None or not summary["calls"]:
+            return None
+        return (summary["input_tokens"] * price[0] + summary["output_tokens"] * price[1]) / 1_000_000
+
+    def select(self, agent):
+        """Model to call first for `agent`."""
+        entry = self._entry(agent)
+        if self.stats is None:
+            return entry["models"][0]
+        max_p95 = entry.get("max_p95_s")
+        max_cost = entry.get("max_cost_usd")
+        measured = []
+        for model in entry["models"]:
+            summary = self.stats.summary(agent, model)
+            if summary["calls"] < MIN_SAMPLES or summary["p95_s"] is None:
+                return model
+            cost = self.estimated_cost(model, summary)
+            if (max_p95 is None or summary["p95_s"] <= max_p95) and (max_cost is None or cost is None or cost <= max_cost):
+                return model
+            measured.append((summary["p95_s"], model))
+        # Nothing fits the budgets: the fastest candidate
+        return min(measured)[1]
+
+    def route(self, agent):
+        """Models to try in order: the selected one, then the escalation models."""
+        entry = self._entry(agent)
+        return list(dict.fromkeys([self.select(agent)] + list(entry.get("escalate", []))))
+
+    def llm(self, agent, model, **kwargs):
+        """Shared ChatOpenAI for (agent, model, kwargs), reporting its calls to the stats store."""
+        # Streamed calls report their token counts too (cost estimate)
+        kwargs.setdefault("stream_usage", True)
+        key = (agent, model, tuple(sorted((name, repr(value)) for name, value in kwargs.items())))
+        llm = self._llms.get(key)
+        if llm is not None:
+            return llm
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                base_url = self.base_url or self.policy.get(agent, {}).get("base_url") or OPENROUTER_BASE_URL
+                llm = ChatOpenAI(
+                    model=model,
+                    openai_api_key=self.api_key if self.api_key is not None else clean_env_var(os.getenv("OPENROUTER_API_KEY")),
+                    openai_api_base=base_url,
+                    callbacks=[_StatsCallback(self.stats, agent, model)] if self.stats is not None else None,
+                    **kwargs
+                )
+                self._llms[key] = llm
+        return llm
+
+    def _failed(self, agent, model, error, models, position):
+        if self.stats is not None:
+            try:
+                self.stats.record(agent, model, error=type(error).__name__)
+            except sqlite3.Error as e:
+                logger.warning("Could not record model stats: %s", e)
+        if position + 1 < len(models):
+            logger.warning("%s: %s answer rejected (%s), escalating to %s", agent, model, error, models[position + 1])
+
+    def run(self, agent, chain_for, inputs, validate=None, models=None):
+        """
+        Invoke `chain_for(model)` on `inputs` (then `validate` on its output)
+        along the route of `agent` (or `models`), escalating on ValueError.
+        """
+        models = models or self.route(agent)
+        for position, model in enumerate(models):
+            try:
+                result = chain_for(model).invoke(inputs)
+                return validate(result) if validate else result
+            except ValueError as e:
+                self._failed(agent, model, e, models, position)
+                if position + 1 == len(models):
+                    if isinstance(e, LowConfidence):
+                        return e.result
+                    raise
+
+    def _after(self, agent, model, error):
+        """Escalation models left after `model` failed with `error` (recorded in the stats)."""
+        models = self.route(agent)
+        position = models.index(model) if model in models else 0
+        self._failed(agent, model, error, models, position)
+        return models[position + 1:]
+
+    def escalate(self, agent, model, error, chain_for, inputs, validate=None):
+        """
+        Continue `run` after an answer of `model` obtained elsewhere (e.g.
+        streamed) was rejected with `error`: try the next models of the route.
+        """
+        models = self._after(agent, model, error)
+        if not models:
+            if isinstance(error, LowConfidence):
+                return error.result
+            raise error
+        return self.run(agent, chain_for, inputs, validate, models=models)
+
+    async def aescalate(self, agent, model, error, chain_for, inputs, validate=None):
+        models = self._after(agent, model, error)
+        if not models:
+            if isinstance(error, LowConfidence):
+                return error.result
+            raise error
+        return await self.arun(agent, chain_for, inputs, validate, models=models)
+
+    async def arun(self, agent, chain_for, inputs, validate=None, models=None):
+        models = models or self.route(agent)
+        for position, model in enumerate(models):
+            try:
+                result = await chain_for(model).ainvoke(inputs)
+                return validate(result) if validate else result
+            except ValueError as e:
+                self._failed(agent, model, e, models, position)
+                if position + 1 == len(models):
+                    if isinstance(e, LowConfidence):
+                        return e.result
+                    raise
+
+
+if __name__ == "__main__":
+    router = ModelRouter()
+    if router.stats is None:
+        print("⚠️ MODEL_STATS_ENABLED=0 : aucune statistique")
+    else:
+        for agent, model in router.stats.routes():
+            summary = router.stats.summary(agent, model)
+            cost = router.estimated_cost(model, summary)
+            print(f"{agent:<9} {model:<30} {summary['calls']:>4} appels  p50={summary['p50_s']}s  "
+                  f"p95={summary['p95_s']}s  erreurs={summary['error_rate']:.0%}  "
+                  f"coût≈{'%.5f $' % cost if cost is not None else 'n/a'}")
+    for agent in router.policy:
+        print(f"🧭 {agent}: {' -> '.join(router.route(agent))}")
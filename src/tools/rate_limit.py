@@ -0,0 +1,47 @@
+"""
+Token-bucket rate limiting for calls to the provider (OpenRouter).
+"""
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second refill a bucket of
+    `capacity`; acquire(n) blocks until n tokens are available.
+
+    Thread-safe, so several embedding workers can share one limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, limit, burst=None):
+        return cls(limit / 60.0, capacity=burst if burst is not None else max(1.0, limit / 60.0))
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1.0):
+        # A request bigger than the bucket could never be served: cap it
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        """Drain the bucket for `seconds` (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
@@ -0,0 +1,83 @@
+"""
+Local second-stage reranker: retrieve wide, keep only the best few chunks.
+
+Every candidate is scored on CPU against the query (the complaint summary and
+category) from a few lexical features. Only the chunks scoring at least
+`min_ratio` of the best candidate go into the prompt, so irrelevant
+1000-character chunks no longer cost prompt tokens. The cutoff is relative:
+absolute scores depend on the query length and on how much the candidates
+share with it, and a fixed bar kept a single chunk for most complaints. No
+network call is involved.
+
+Features, each in [0, 1]:
+    coverage  share of the query terms found in the chunk, weighted by idf
+              over the candidate set (rare legal terms count more)
+    phrases   share of the query bigrams found in the chunk (التطهير السائل)
+    prior     1 / (1 + rank) of the first-stage (vector/BM25) ranking
+Chunks shorter than MIN_USEFUL_CHARS (OCR debris, headers) are halved.
+"""
+import os
+import math
+import logging
+
+from src.tools.arabic import tokenize
+
+logger = logging.getLogger(__name__)
+
+RERANK_WEIGHTS = {"coverage": 0.6, "phrases": 0.25, "prior": 0.15}
+# Share of the best candidate's score a chunk needs to be kept
+RERANK_MIN_RATIO = float(os.getenv("RERANK_MIN_RATIO", "0.3"))
+MIN_USEFUL_CHARS = 120
+
+
+def _bigrams(terms):
+    return set(zip(terms, terms[1:]))
+
+
+class LocalReranker:
+    def __init__(self, weights=None, min_ratio=RERANK_MIN_RATIO, min_keep=1):
+        self.weights = weights or RERANK_WEIGHTS
+        self.min_ratio = min_ratio
+        # Never hand an empty context to the LLM: the best chunk is always kept
+        self.min_keep = min_keep
+
+    def score(self, query, docs):
+        """Feature score of every doc (in order), between 0 and 1."""
+        query_terms = tokenize(query)
+        query_set = set(query_terms)
+        query_bigrams = _bigrams(query_terms)
+        doc_terms = [tokenize(doc.page_content) for doc in docs]
+        doc_sets = [set(terms) for terms in doc_terms]
+
+        count = len(docs)
+        idf = {
+            term: math.log(1.0 + count / (1 + sum(term in terms for terms in doc_sets)))
+            for term in query_set
+        }
+        total_idf = sum(idf.values()) or 1.0
+
+        scores = []
+        for rank, (doc, terms, term_set) in enumerate(zip(docs, doc_terms, doc_sets)):
+            features = {
+                "coverage": sum(idf[term] for term in query_set & term_set) / total_idf,
+                "phrases": len(query_bigrams & _bigrams(terms)) / len(query_bigrams) if query_bigrams else 0.0,
+                "prior": 1.0 / (1 + rank),
+            }
+            score = sum(self.weights[name] * value for name, value in features.items())
+            if len(doc.page_content) < MIN_USEFUL_CHARS:
+                score *= 0.5
+            scores.append(score)
+        return scores
+
+    def rerank(self, query, docs, top_n, min_ratio=None):
+        """Best `top_n` docs scoring at least `min_ratio` of the best one (the first `min_keep` are kept regardless)."""
+        if not docs:
+            return []
+        min_ratio = self.min_ratio if min_ratio is None else min_ratio
+        scores = self.score(query, docs)
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)[:top_n]
+        min_score = min_ratio * scores[order[0]]
+        kept = [i for position, i in enumerate(order) if position < self.min_keep or scores[i] >= min_score]
+        if len(kept) < len(order):
+            logger.debug("Reranker dropped %d/%d candidates below %.2f", len(order) - len(kept), len(order), min_score)
+        return [docs[i] for i in kept]
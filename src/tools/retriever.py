@@ -1,38 +1,289 @@
 import os
 import re
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from dotenv import load_dotenv
 from langchain_openai import OpenAIEmbeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
 from langchain_community.vectorstores import Chroma
+from src.tools.embedding_cache import CachedEmbeddings, EMBEDDING_CACHE_ENABLED
+from src.tools.bm25 import BM25Index
+from src.tools.reranker import LocalReranker
+from src.tools.flat_index import FlatVectorStore, FLAT_INDEX_DIRECTORY
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 # Hardcoded base URL - no environment variable needed
 OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 
+PERSIST_DIRECTORY = "data/processed/chroma_db"
+EMBEDDING_MODEL = "openai/text-embedding-3-small"
+DEFAULT_K = 3
+# "chroma": persistent Chroma client ; "flat": memory-mapped matrix (src/tools/flat_index.py) ;
+# "flat_int8": same index, int8 first pass + exact re-ranking of the best candidates
+VECTOR_BACKENDS = ("chroma", "flat", "flat_int8")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# "vector": Chroma only ; "hybrid": BM25 + vector ; "lexical": BM25 only (no embedding call)
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+# Weight of the vector ranking in the hybrid fusion (BM25 gets the rest)
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))
+# Candidates taken from each side before fusing
+HYBRID_FETCH_K = 10
+# Two stages: fetch RERANK_FETCH_K candidates, keep the best DEFAULT_K the
+# local reranker keeps within RERANK_MIN_RATIO of its top score (src/tools/reranker.py)
+RERANK_ENABLED = os.getenv("RERANK", "1") not in ("0", "false", "False")
+RERANK_FETCH_K = 12
+# Searches of one multi-query retrieval run in parallel on this many threads
+MULTI_QUERY_WORKERS = 4
+_query_pool = None
+_query_pool_lock = threading.Lock()
+
 def clean_env_var(value):
     """Remove all non-printable characters from a string."""
     if not value:
         return ""
     return re.sub(r'[\x00-\x1f\x7f-\x9f]', '', value).strip()
 
-def get_retriever():
-    persist_directory = "data/processed/chroma_db"
-    
-    # نفس الإعدادات اللي درنا ف الـ Ingestion
+def get_embeddings(base_url=OPENROUTER_BASE_URL, max_retries=2):
+    # نفس الإعدادات ف الـ Ingestion و الـ Retrieval (نفس الكاش كذلك)
     embeddings = OpenAIEmbeddings(
-        model="openai/text-embedding-3-small",
+        model=EMBEDDING_MODEL,
         openai_api_key=clean_env_var(os.getenv("OPENROUTER_API_KEY")),
-        openai_api_base=OPENROUTER_BASE_URL
+        openai_api_base=base_url,
+        max_retries=max_retries,
+        # Send plain strings: chunks are far below the 8191-token limit, and this
+        # avoids downloading the tiktoken vocabulary (offline tests, fake endpoint)
+        check_embedding_ctx_length=False
     )
-    
+    if not EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(embeddings, namespace=EMBEDDING_MODEL)
+
+def get_vectorstore(embeddings=None, backend=VECTOR_BACKEND):
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend {backend!r}, expected one of {VECTOR_BACKENDS}")
+    if backend in ("flat", "flat_int8"):
+        if FlatVectorStore.exists(FLAT_INDEX_DIRECTORY):
+            return FlatVectorStore(FLAT_INDEX_DIRECTORY, embeddings or get_embeddings(), quantized=backend == "flat_int8")
+        logger.warning("No flat index in %s (run the ingestion): using Chroma", FLAT_INDEX_DIRECTORY)
+
     # تحميل قاعدة البيانات
-    vectorstore = Chroma(
-        persist_directory=persist_directory,
-        embedding_function=embeddings
+    return Chroma(
+        persist_directory=PERSIST_DIRECTORY,
+        embedding_function=embeddings or get_embeddings()
     )
-    
+
+def doc_key(doc):
+    """Identity of a chunk across several result lists."""
+    return (doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content)
+
+def _ranks(hits):
+    """{key: rank} of (doc, score) hits, best score first; a chunk listed twice keeps its best."""
+    best = {}
+    docs = {}
+    for doc, score in hits:
+        key = doc.metadata.get("chunk_id") or doc_key(doc)
+        docs.setdefault(key, doc)
+        best[key] = max(score, best.get(key, score))
+    ordered = sorted(best, key=lambda key: best[key], reverse=True)
+    return {key: rank for rank, key in enumerate(ordered)}, docs
+
+def fuse_scores(vector_hits, lexical_hits, k=DEFAULT_K, alpha=HYBRID_ALPHA, rrf_k=60):
+    """
+    Merge (doc, score) lists from Chroma and BM25 by weighted reciprocal rank:
+    alpha / (rrf_k + vector rank) + (1 - alpha) / (rrf_k + BM25 rank). Ranks
+    rather than rescaled scores: BM25 scores have no fixed scale, and a side
+    with a single (or constant) score must not count as a perfect match. A
+    chunk found by one side only gets nothing from the other.
+    """
+    vector_ranks, docs = _ranks(vector_hits)
+    lexical_ranks, lexical_docs = _ranks(lexical_hits)
+    for key, doc in lexical_docs.items():
+        docs.setdefault(key, doc)
+    fused = {
+        key: (alpha / (rrf_k + vector_ranks[key] + 1) if key in vector_ranks else 0.0)
+        + ((1.0 - alpha) / (rrf_k + lexical_ranks[key] + 1) if key in lexical_ranks else 0.0)
+        for key in docs
+    }
+    ranked = sorted(fused, key=lambda key: fused[key], reverse=True)
+    return [docs[key] for key in ranked[:k]]
+
+class LexicalRetriever(BaseRetriever):
+    """BM25 only: answers from the in-process index, with no embedding round trip."""
+    lexical_index: BM25Index
+    k: int = DEFAULT_K
+    filter: Optional[dict] = None
+    # Accepted for symmetry with the other modes: BM25 scores have no fixed
+    # scale, and a lexical hit already shares terms with the query
+    score_threshold: Optional[float] = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [doc for doc, _ in self.lexical_index.search(query, k=self.k, filter=self.filter)]
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        return self._get_relevant_documents(query)
+
+class HybridRetriever(BaseRetriever):
+    """BM25 + dense retrieval, fused by weighted reciprocal rank (see fuse_scores)."""
+    vectorstore: VectorStore
+    lexical_index: BM25Index
+    k: int = DEFAULT_K
+    fetch_k: int = HYBRID_FETCH_K
+    alpha: float = HYBRID_ALPHA
+    filter: Optional[dict] = None
+    # Vector hits below this relevance are dropped before fusing
+    score_threshold: Optional[float] = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _search_kwargs(self):
+        kwargs = {"k": max(self.fetch_k, self.k)}
+        if self.filter:
+            kwargs["filter"] = self.filter
+        return kwargs
+
+    def _fuse(self, vector_hits, query):
+        if self.score_threshold is not None:
+            vector_hits = [(doc, score) for doc, score in vector_hits if score >= self.score_threshold]
+        lexical_hits = self.lexical_index.search(query, k=max(self.fetch_k, self.k), filter=self.filter)
+        return fuse_scores(vector_hits, lexical_hits, k=self.k, alpha=self.alpha)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        vector_hits = self.vectorstore.similarity_search_with_relevance_scores(query, **self._search_kwargs())
+        return self._fuse(vector_hits, query)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        vector_hits = await self.vectorstore.asimilarity_search_with_relevance_scores(query, **self._search_kwargs())
+        return self._fuse(vector_hits, query)
+
+class RerankingRetriever(BaseRetriever):
+    """`base` fetches a wide candidate set, LocalReranker keeps the best `k` above its threshold."""
+    base: BaseRetriever
+    reranker: LocalReranker
+    k: int = DEFAULT_K
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def lexical_index(self):
+        return getattr(self.base, "lexical_index", None)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.reranker.rerank(query, self.base.invoke(query), self.k)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        return self.reranker.rerank(query, await self.base.ainvoke(query), self.k)
+
+def get_retriever(vectorstore=None, k=DEFAULT_K, mode=RETRIEVAL_MODE, lexical_index=None, backend=VECTOR_BACKEND,
+                  rerank=RERANK_ENABLED):
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+    if rerank:
+        base = get_retriever(vectorstore, max(k, RERANK_FETCH_K), mode, lexical_index, backend, rerank=False)
+        return RerankingRetriever(base=base, reranker=LocalReranker(), k=k)
+    if mode != "vector" and lexical_index is None:
+        lexical_index = BM25Index()
+    if mode == "lexical":
+        return LexicalRetriever(lexical_index=lexical_index, k=k)
+
+    if vectorstore is None:
+        vectorstore = get_vectorstore(backend=backend)
+    if mode == "hybrid":
+        return HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index, k=k)
+
     # تحويلها لـ Retriever (كيجيب أحسن 3 قطع مناسبة لكل سؤال)
-    return vectorstore.as_retriever(search_kwargs={"k": 3})
+    return vectorstore.as_retriever(search_kwargs={"k": k})
+
+def first_stage(retriever):
+    """The candidate retriever of a two-stage retriever (the retriever itself otherwise)."""
+    return retriever.base if isinstance(retriever, RerankingRetriever) else retriever
+
+def with_k(retriever, k):
+    """Copy of `retriever` (any of the modes above) returning `k` documents."""
+    if isinstance(retriever, RerankingRetriever):
+        return retriever.model_copy(update={"k": k, "base": with_k(retriever.base, max(k, RERANK_FETCH_K))})
+    if hasattr(retriever, "search_kwargs"):
+        return retriever.model_copy(update={"search_kwargs": {**retriever.search_kwargs, "k": k}})
+    return retriever.model_copy(update={"k": k})
+
+def with_filter(retriever, filter, score_threshold=None):
+    """
+    Copy of `retriever` restricted to chunks whose metadata matches `filter`,
+    keeping only vector hits with a relevance of at least `score_threshold`.
+    """
+    if isinstance(retriever, RerankingRetriever):
+        return retriever.model_copy(update={"base": with_filter(retriever.base, filter, score_threshold)})
+    if hasattr(retriever, "search_kwargs"):
+        search_kwargs = {**retriever.search_kwargs, "filter": filter}
+        update = {"search_kwargs": search_kwargs}
+        if score_threshold is not None:
+            search_kwargs["score_threshold"] = score_threshold
+            update["search_type"] = "similarity_score_threshold"
+        return retriever.model_copy(update=update)
+    return retriever.model_copy(update={"filter": filter, "score_threshold": score_threshold})
+
+def reciprocal_rank_fusion(result_lists, top_n=DEFAULT_K, rrf_k=60):
+    """Merge several ranked lists of documents into one (RRF), dropping duplicates."""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [docs[key] for key in ranked[:top_n]]
+
+def _get_query_pool():
+    global _query_pool
+    if _query_pool is None:
+        with _query_pool_lock:
+            if _query_pool is None:
+                _query_pool = ThreadPoolExecutor(max_workers=MULTI_QUERY_WORKERS, thread_name_prefix="multi-query")
+    return _query_pool
+
+def multi_query_candidates(retriever, queries, k=RERANK_FETCH_K):
+    """
+    Search every query variant and merge the result lists with RRF.
+
+    The variants are embedded in one embed_documents request, then searched
+    concurrently by vector (and with BM25 when the retriever has an index).
+    """
+    retriever = first_stage(retriever)
+    vectorstore = getattr(retriever, "vectorstore", None)
+    lexical_index = getattr(retriever, "lexical_index", None)
+    result_lists = []
+    if vectorstore is not None:
+        vectors = vectorstore.embeddings.embed_documents(queries)
+        result_lists += list(_get_query_pool().map(
+            lambda vector: vectorstore.similarity_search_by_vector(vector, k=k), vectors
+        ))
+    if lexical_index is not None:
+        result_lists += [[doc for doc, _ in lexical_index.search(query, k=k)] for query in queries]
+    return reciprocal_rank_fusion(result_lists, top_n=k)
+
+async def amulti_query_candidates(retriever, queries, k=RERANK_FETCH_K):
+    retriever = first_stage(retriever)
+    vectorstore = getattr(retriever, "vectorstore", None)
+    lexical_index = getattr(retriever, "lexical_index", None)
+    result_lists = []
+    if vectorstore is not None:
+        vectors = await vectorstore.embeddings.aembed_documents(queries)
+        result_lists += await asyncio.gather(*(
+            vectorstore.asimilarity_search_by_vector(vector, k=k) for vector in vectors
+        ))
+    if lexical_index is not None:
+        result_lists += [[doc for doc, _ in lexical_index.search(query, k=k)] for query in queries]
+    return reciprocal_rank_fusion(result_lists, top_n=k)
 
 # تجربة صغيرة للتأكد
 if __name__ == "__main__":
@@ -40,4 +291,4 @@ if __name__ == "__main__":
     results = retriever.invoke("ما هي اختصاصات الجماعة في مجال النظافة؟")
     print(f"تم العثور على {len(results)} نتائج من القانون.")
     for doc in results:
-        print(f"- {doc.page_content[:100]}...")
\ No newline at end of file
+        print(f"- {doc.page_content[:100]}...")
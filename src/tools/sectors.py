@@ -0,0 +1,101 @@
+"""
+Competence sectors of the commune, shared by ingestion and retrieval.
+
+Ingestion tags every chunk with the sectors its text covers (keyword lexicon
+below, matched on normalized Arabic). Each sector becomes a boolean metadata
+field (`sector_water`, ...) that Chroma, the flat index and BM25 can all
+filter on, plus a readable `sectors` string. Triage categories (ماء، إنارة...)
+map to the same codes, so RAG can search the partition of the complaint's
+sector first.
+"""
+from src.tools.arabic import normalize, tokenize
+
+# Bump when the lexicon changes: ingestion then re-tags every chunk
+SECTORS_VERSION = 1
+
+SECTORS = {
+    "water": {
+        "categories": ("ماء", "تطهير سائل", "الماء", "eau", "assainissement"),
+        "keywords": ("ماء", "مياه", "الماء الصالح للشرب", "التطهير السائل", "الصرف الصحي", "المياه العادمة",
+                     "قنوات", "الواد الحار", "مجاري", "السقي"),
+    },
+    "lighting": {
+        "categories": ("إنارة", "إنارة عمومية", "الإنارة العمومية", "éclairage"),
+        "keywords": ("الإنارة العمومية", "إنارة", "الكهرباء", "توزيع الكهرباء", "مصابيح", "أعمدة"),
+    },
+    "waste": {
+        "categories": ("نفايات", "النظافة", "déchets"),
+        "keywords": ("النفايات", "نفايات", "النفايات المنزلية", "النظافة", "جمع النفايات", "المطارح", "الأزبال"),
+    },
+    "roads": {
+        "categories": ("طرق", "الطرق", "voirie", "routes"),
+        "keywords": ("الطرق", "الطرقات", "السير", "الجولان", "التشوير", "الأرصفة", "المسالك", "الطرق الجماعية",
+                     "النقل العمومي", "الوقوف"),
+    },
+    "admin": {
+        "categories": ("إداري", "إدارية", "administratif"),
+        "keywords": ("الحالة المدنية", "تصحيح الإمضاء", "مطابقة النسخ", "الوثائق", "الشواهد", "الرخص",
+                     "الشواهد الإدارية", "رخص البناء", "المصالح الإدارية"),
+    },
+    "other": {
+        "categories": ("أخرى", "autre"),
+        "keywords": (),
+    },
+}
+SECTOR_CODES = tuple(SECTORS)
+
+
+def _phrase(text):
+    return " ".join(tokenize(text))
+
+
+_KEYWORDS = {code: tuple({_phrase(keyword) for keyword in spec["keywords"]}) for code, spec in SECTORS.items()}
+_CATEGORIES = {normalize(label).strip(): code for code, spec in SECTORS.items() for label in spec["categories"]}
+_CATEGORIES.update({_phrase(label): code for code, spec in SECTORS.items() for label in spec["categories"]})
+# The codes themselves ("water", "other"...) are valid labels too
+_CATEGORIES.update({code: code for code in SECTORS})
+
+
+def tag_sectors(text):
+    """Sector codes whose keywords appear in `text` ("other" when none do)."""
+    padded = f" {_phrase(text)} "
+    found = [code for code, keywords in _KEYWORDS.items() if any(f" {keyword} " in padded for keyword in keywords)]
+    return found or ["other"]
+
+
+def sector_metadata(text):
+    """Chunk metadata: one boolean per sector plus the comma-separated list."""
+    found = tag_sectors(text)
+    metadata = {f"sector_{code}": code in found for code in SECTOR_CODES}
+    metadata["sectors"] = ",".join(found)
+    return metadata
+
+
+def category_code(category):
+    """Sector code of a triage category, "other" included, or None if it is unknown."""
+    label = normalize(category or "").strip()
+    code = _CATEGORIES.get(label) or _CATEGORIES.get(_phrase(category or ""))
+    if code is not None:
+        return code
+    # "تطهير سائل/ماء" and other free forms: fall back to the keyword lexicon
+    code = tag_sectors(category or "")[0]
+    return None if code == "other" else code
+
+
+def category_sector(category):
+    """Sector code of a triage category, or None if it is unknown or "other"."""
+    code = category_code(category)
+    return None if code == "other" else code
+
+
+def sector_filter(code):
+    return {f"sector_{code}": True}
+
+
+def manifest_sector_counts(manifest):
+    """Chunks per sector code over every source of the ingestion manifest."""
+    counts = {}
+    for entry in manifest.get("sources", {}).values():
+        for code, count in entry.get("sector_counts", {}).items():
+            counts[code] = counts.get(code, 0) + count
+    return counts
@@ -0,0 +1,88 @@
+"""
+Semantic near-duplicate cache for triage results.
+
+During outages and storms the hotline receives floods of paraphrases of the
+same report ("البولة طافية" / "الضو مقطوع فالحومة"). Each complaint is embedded
+once; if a previous complaint is closer than `threshold` (cosine similarity),
+its triage analysis is reused and the LLM is not called at all.
+
+The index is a fixed-size in-memory matrix with least-recently-used eviction,
+so memory stays bounded however long the process runs.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("TRIAGE_SEMANTIC_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("TRIAGE_SEMANTIC_CACHE_SIZE", "5000"))
+SEMANTIC_CACHE_ENABLED = os.getenv("TRIAGE_SEMANTIC_CACHE", "1") not in ("0", "false", "False")
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticTriageCache:
+    def __init__(self, embeddings, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._matrix = None  # allocated on first insert, once the dimension is known
+        self._size = 0
+        # slot -> analysis, oldest access first
+        self._entries = OrderedDict()
+
+    def embed(self, complaint_text):
+        return _normalize(self.embeddings.embed_query(complaint_text))
+
+    async def aembed(self, complaint_text):
+        return _normalize(await self.embeddings.aembed_query(complaint_text))
+
+    def lookup(self, vector):
+        """Analysis of the closest cached complaint above the threshold, or None."""
+        with self._lock:
+            if not self._size:
+                self.misses += 1
+                return None
+            scores = self._matrix[:self._size] @ vector
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return dict(self._entries[slot])
+
+    def add(self, vector, analysis):
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                # Reuse the slot of the least recently used complaint
+                slot, _ = self._entries.popitem(last=False)
+            self._matrix[slot] = vector
+            self._entries[slot] = dict(analysis)
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,47 @@
+"""
+Small helpers to pass streamed LLM chunks between threads.
+
+The dashboard renders the legal advice while the reporter consumes the very
+same chunks, so one producer has to feed several independent readers.
+"""
+import queue
+
+_DONE = object()
+
+
+class ChunkChannel:
+    """Thread-safe pipe: a producer puts text chunks, one consumer iterates them."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, chunk):
+        self._queue.put(chunk)
+
+    def close(self, error=None):
+        """End the stream; if `error` is given the consumer re-raises it."""
+        self._queue.put(error if error is not None else _DONE)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+def fan_out(chunks, *channels):
+    """Copy every chunk of `chunks` into each channel, then close them (run in a worker thread)."""
+    try:
+        for chunk in chunks:
+            for channel in channels:
+                channel.put(chunk)
+    except Exception as e:
+        for channel in channels:
+            channel.close(e)
+        raise
+    for channel in channels:
+        channel.close()
+
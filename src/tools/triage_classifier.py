@@ -0,0 +1,321 @@
+"""
+Local triage classifier distilled from logged LLM triage outputs.
+
+Most hotline complaints are obvious ("البولة طافية" is إنارة), yet each one
+paid a gpt-4o-mini round trip. This is a linear softmax model over hashed
+character n-grams (2-4, on normalized text, so Darija spellings and typos
+still share features), one head for `category` and one for `urgency`.
+Prediction takes well under a millisecond on CPU. TriageAgent answers locally
+when both heads are at least TRIAGE_LOCAL_THRESHOLD confident, and calls the
+LLM otherwise.
+
+With TRIAGE_LOG=1 (off by default: the log keeps the citizens' complaint
+text), TriageAgent logs every LLM analysis to TRIAGE_LOG_PATH (JSONL); that
+log is the training set. Past TRIAGE_LOG_MAX_BYTES it is rotated to a single
+".1" backup, which training reads too, so at most twice that size is kept:
+
+    python -m src.tools.triage_classifier train            # train + holdout report
+    python -m src.tools.triage_classifier report --log other.jsonl
+
+`train` does not save a model trained on fewer than TRIAGE_MIN_EXAMPLES
+examples, with a single class for a head, or whose holdout accuracy when it
+answers locally is below TRIAGE_MIN_ACCURACY.
+"""
+import os
+import json
+import time
+import zlib
+import argparse
+import threading
+
+import numpy as np
+
+from src.tools.arabic import normalize
+
+TRIAGE_LOG_PATH = os.getenv("TRIAGE_LOG_PATH", "data/cache/triage_log.jsonl")
+TRIAGE_MODEL_PATH = os.getenv("TRIAGE_MODEL_PATH", "data/cache/triage_classifier.npz")
+TRIAGE_LOCAL_THRESHOLD = float(os.getenv("TRIAGE_LOCAL_THRESHOLD", "0.85"))
+TRIAGE_LOCAL_ENABLED = os.getenv("TRIAGE_LOCAL", "1") not in ("0", "false", "False")
+TRIAGE_LOG_ENABLED = os.getenv("TRIAGE_LOG", "0") not in ("0", "false", "False")
+TRIAGE_LOG_MAX_BYTES = int(os.getenv("TRIAGE_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+# A model is only saved if it was trained on enough data and is right often
+# enough on the holdout when it answers locally
+TRIAGE_MIN_EXAMPLES = int(os.getenv("TRIAGE_MIN_EXAMPLES", "100"))
+TRIAGE_MIN_ACCURACY = float(os.getenv("TRIAGE_MIN_ACCURACY", "0.95"))
+
+HASH_DIMENSIONS = 1 << 18
+NGRAM_SIZES = (2, 3, 4)
+HEADS = ("category", "urgency")
+
+# Words that only appear in Darija, to label `original_language` locally
+_DARIJA_MARKERS = {"ديال", "كاين", "كاينه", "بزاف", "واش", "علاش", "دابا", "حيت", "ماكاينش", "غادي", "ديالنا",
+                   "فالحومه", "هادي", "هادا", "شي", "مزيان", "بغيت", "عافاكم", "راه"}
+
+
+def features(text):
+    """Hashed, sublinear-tf, L2-normalized char n-grams: (indices, values)."""
+    text = f" {' '.join(normalize(text).split())} "
+    counts = {}
+    for size in NGRAM_SIZES:
+        for start in range(len(text) - size + 1):
+            index = zlib.crc32(f"{size}:{text[start:start + size]}".encode("utf-8")) % HASH_DIMENSIONS
+            counts[index] = counts.get(index, 0) + 1
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return indices, (values / np.linalg.norm(values)).astype(np.float32)
+
+
+def detect_language(text):
+    if sum(char.isascii() and char.isalpha() for char in text) > len(text) / 2:
+        return "Français"
+    words = set(normalize(text).split())
+    return "الدارجة المغربية" if words & _DARIJA_MARKERS else "العربية"
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class _Batch:
+    """Rows of hashed features packed CSR-style for vectorized training."""
+
+    def __init__(self, texts):
+        rows = [features(text) for text in texts]
+        self.size = len(rows)
+        self.indices = np.concatenate([indices for indices, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        self.values = np.concatenate([values for _, values in rows]) if rows else np.zeros(0, dtype=np.float32)
+        self.rows = np.repeat(np.arange(self.size), [len(indices) for indices, _ in rows])
+
+    def logits(self, weights, bias):
+        out = np.zeros((self.size, weights.shape[1]), dtype=np.float32)
+        np.add.at(out, self.rows, weights[self.indices] * self.values[:, None])
+        return out + bias
+
+    def gradient(self, error, dimensions):
+        grad = np.zeros((dimensions, error.shape[1]), dtype=np.float32)
+        np.add.at(grad, self.indices, error[self.rows] * self.values[:, None])
+        return grad
+
+
+class TriageClassifier:
+    def __init__(self, heads=None, threshold=TRIAGE_LOCAL_THRESHOLD):
+        # head -> {"labels": [...], "weights": (D, C), "bias": (C,)}
+        self.heads = heads or {}
+        self.threshold = threshold
+
+    # --- Training ----------------------------------------------------------
+
+    @classmethod
+    def train(cls, texts, targets, epochs=60, learning_rate=0.5, l2=1e-5, threshold=TRIAGE_LOCAL_THRESHOLD):
+        """`targets` maps each head to its label list (same order as `texts`)."""
+        batch = _Batch(texts)
+        heads = {}
+        for head, labels in targets.items():
+            classes = sorted(set(labels))
+            y = np.zeros((len(labels), len(classes)), dtype=np.float32)
+            y[np.arange(len(labels)), [classes.index(label) for label in labels]] = 1.0
+            weights = np.zeros((HASH_DIMENSIONS, len(classes)), dtype=np.float32)
+            bias = np.zeros(len(classes), dtype=np.float32)
+            # Full-batch gradient descent with Adam: the log is small and sparse
+            moments = [np.zeros_like(weights), np.zeros_like(weights), np.zeros_like(bias), np.zeros_like(bias)]
+            for step in range(1, epochs + 1):
+                error = (_softmax(batch.logits(weights, bias)) - y) / max(len(labels), 1)
+                for param, grad, m, v in ((weights, batch.gradient(error, HASH_DIMENSIONS) + l2 * weights,
+                                           moments[0], moments[1]),
+                                          (bias, error.sum(axis=0), moments[2], moments[3])):
+                    m *= 0.9
+                    m += 0.1 * grad
+                    v *= 0.999
+                    v += 0.001 * grad * grad
+                    param -= learning_rate * 0.1 * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+            heads[head] = {"labels": classes, "weights": weights, "bias": bias}
+        return cls(heads, threshold)
+
+    # --- Persistence -------------------------------------------------------
+
+    def save(self, path=TRIAGE_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {}
+        for head, model in self.heads.items():
+            arrays[f"{head}_weights"] = model["weights"].astype(np.float16)
+            arrays[f"{head}_bias"] = model["bias"]
+        arrays["meta"] = np.array(json.dumps({head: model["labels"] for head, model in self.heads.items()}))
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=TRIAGE_MODEL_PATH, threshold=TRIAGE_LOCAL_THRESHOLD):
+        with np.load(path) as data:
+            labels = json.loads(str(data["meta"]))
+            heads = {
+                head: {
+                    "labels": head_labels,
+                    "weights": data[f"{head}_weights"].astype(np.float32),
+                    "bias": data[f"{head}_bias"],
+                }
+                for head, head_labels in labels.items()
+            }
+        return cls(heads, threshold)
+
+    # --- Prediction --------------------------------------------------------
+
+    def predict(self, text):
+        """{head: (label, probability)} for one complaint."""
+        indices, values = features(text)
+        predictions = {}
+        for head, model in self.heads.items():
+            logits = values @ model["weights"][indices] + model["bias"]
+            probabilities = _softmax(logits[None, :])[0]
+            best = int(np.argmax(probabilities))
+            predictions[head] = (model["labels"][best], float(probabilities[best]))
+        return predictions
+
+    def analyze(self, text):
+        """
+        Triage analysis in the LLM's format if every head is confident enough,
+        else None. There is no local summarizer: summary_ar is the complaint.
+        """
+        predictions = self.predict(text)
+        if not predictions or any(probability < self.threshold for _, probability in predictions.values()):
+            return None
+        return {
+            "category": predictions["category"][0],
+            "summary_ar": text.strip(),
+            "urgency": predictions["urgency"][0],
+            "original_language": detect_language(text),
+            "source": "local",
+            "confidence": round(min(probability for _, probability in predictions.values()), 3),
+        }
+
+
+# --- Training data and reports ---------------------------------------------
+
+_log_lock = threading.Lock()
+
+
+def append_triage_log(complaint_text, analysis, path=TRIAGE_LOG_PATH, max_bytes=TRIAGE_LOG_MAX_BYTES):
+    """Record one LLM triage (the training data of the classifier), rotating the log past `max_bytes`."""
+    line = json.dumps({"complaint": complaint_text, "analysis": analysis}, ensure_ascii=False)
+    with _log_lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+            os.replace(path, path + ".1")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def read_triage_log(path=TRIAGE_LOG_PATH):
+    """(text, analysis) pairs of the log and its rotated backup, skipping incomplete analyses."""
+    examples = []
+    for log_path in (path + ".1", path):
+        if log_path != path and not os.path.exists(log_path):
+            continue
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                analysis = record.get("analysis") or {}
+                if record.get("complaint") and all(analysis.get(head) for head in HEADS):
+                    examples.append((record["complaint"], analysis))
+    return examples
+
+
+def split_holdout(examples, holdout=0.2):
+    """Deterministic split on the text hash, so retraining keeps the same test set."""
+    train, test = [], []
+    for text, analysis in examples:
+        bucket = zlib.crc32(text.encode("utf-8")) % 1000 / 1000
+        (test if bucket < holdout else train).append((text, analysis))
+    return train, test
+
+
+def evaluate(classifier, examples):
+    """Accuracy per head, coverage/accuracy at the threshold, and prediction latency."""
+    if not examples:
+        return {}
+    latencies = []
+    correct = {head: 0 for head in HEADS}
+    covered = covered_correct = 0
+    for text, analysis in examples:
+        started = time.perf_counter()
+        predictions = classifier.predict(text)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits = {head: predictions[head][0] == analysis[head] for head in HEADS}
+        for head in HEADS:
+            correct[head] += hits[head]
+        if all(predictions[head][1] >= classifier.threshold for head in HEADS):
+            covered += 1
+            covered_correct += all(hits.values())
+    latencies.sort()
+    report = {f"{head}_accuracy": round(correct[head] / len(examples), 4) for head in HEADS}
+    report.update({
+        "examples": len(examples),
+        "threshold": classifier.threshold,
+        "local_coverage": round(covered / len(examples), 4),
+        "local_accuracy": round(covered_correct / covered, 4) if covered else None,
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+    })
+    return report
+
+
+def training_problems(train_set, report, min_examples=TRIAGE_MIN_EXAMPLES, min_accuracy=TRIAGE_MIN_ACCURACY):
+    """Reasons not to deploy a model trained on `train_set` with holdout `report` (empty list: OK)."""
+    problems = []
+    if len(train_set) < min_examples:
+        problems.append(f"{len(train_set)} training examples, at least {min_examples} needed")
+    for head, labels in _targets(train_set).items():
+        if len(set(labels)) < 2:
+            problems.append(f"head {head!r} has fewer than 2 classes")
+    if not report:
+        problems.append("empty holdout, the model cannot be checked")
+    elif report["local_accuracy"] is None:
+        problems.append("no holdout example is confident enough to be answered locally")
+    elif report["local_accuracy"] < min_accuracy:
+        problems.append(f"holdout local accuracy {report['local_accuracy']} below {min_accuracy}")
+    return problems
+
+
+def _targets(examples):
+    return {head: [analysis[head] for _, analysis in examples] for head in HEADS}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classifieur local de triage (n-grammes de caractères + modèle linéaire)")
+    parser.add_argument("command", choices=("train", "report"), help="entraîner ou évaluer le modèle")
+    parser.add_argument("--log", default=TRIAGE_LOG_PATH, help="journal JSONL des triages LLM")
+    parser.add_argument("--model", default=TRIAGE_MODEL_PATH, help="fichier du modèle")
+    parser.add_argument("--holdout", type=float, default=0.2, help="part du journal réservée à l'évaluation")
+    parser.add_argument("--epochs", type=int, default=60, help="itérations d'entraînement")
+    parser.add_argument("--threshold", type=float, default=TRIAGE_LOCAL_THRESHOLD, help="confiance minimale pour répondre localement")
+    parser.add_argument("--min-examples", type=int, default=TRIAGE_MIN_EXAMPLES, help="exemples d'entraînement minimum pour enregistrer le modèle")
+    parser.add_argument("--min-accuracy", type=float, default=TRIAGE_MIN_ACCURACY, help="précision locale minimale sur l'évaluation pour enregistrer le modèle")
+    args = parser.parse_args()
+
+    examples = read_triage_log(args.log)
+    if args.command == "train":
+        train_set, test_set = split_holdout(examples, args.holdout)
+        print(f"📚 {len(train_set)} exemples d'entraînement, {len(test_set)} d'évaluation")
+        started = time.perf_counter()
+        model = TriageClassifier.train([text for text, _ in train_set], _targets(train_set),
+                                       epochs=args.epochs, threshold=args.threshold)
+        print(f"⏱️ Entraînement : {time.perf_counter() - started:.1f} s")
+        report = evaluate(model, test_set)
+        print(json.dumps(report, ensure_ascii=False, indent=1))
+        problems = training_problems(train_set, report, args.min_examples, args.min_accuracy)
+        if problems:
+            for problem in problems:
+                print(f"❌ {problem}")
+            print(f"❌ Modèle non enregistré ({args.model} inchangé)")
+            raise SystemExit(1)
+        model.save(args.model)
+        print(f"✅ Modèle enregistré : {args.model}")
+    else:
+        model = TriageClassifier.load(args.model, threshold=args.threshold)
+        print(json.dumps(evaluate(model, examples), ensure_ascii=False, indent=1))
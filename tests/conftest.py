@@ -0,0 +1,31 @@
+import threading
+
+import pytest
+
+from src.tools import fake_chat_server, fake_embeddings_server
+
+
+def _start(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+@pytest.fixture
+def embeddings_server():
+    """Fake embeddings endpoint on a free port; yields (base_url, handler class)."""
+    server = fake_embeddings_server.serve(port=0, dimensions=8)
+    handler = fake_embeddings_server.FakeEmbeddingsHandler
+    handler.requests_served = 0
+    yield _start(server), handler
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def chat_server():
+    """Fake chat endpoint on a free port; yields (base_url, handler class) to set latencies/invalid models."""
+    server = fake_chat_server.serve(port=0)
+    yield _start(server), fake_chat_server.FakeChatHandler
+    server.shutdown()
+    server.server_close()
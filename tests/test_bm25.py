@@ -0,0 +1,36 @@
+from langchain_core.documents import Document
+
+from src.ingestion import _new_chunks
+from src.tools.bm25 import BM25Index
+
+SOURCE = "data/raw/loi.pdf"
+
+
+def _docs(*texts):
+    return [Document(page_content=text, metadata={"source": SOURCE}) for text in texts]
+
+
+def _ingest(index, docs, stored=()):
+    seen_ids = {}
+    embedded = [doc_id for doc_id, _ in _new_chunks(SOURCE, docs, set(stored), seen_ids,
+                                                    on_chunk=lambda doc: index.add(SOURCE, doc))]
+    index.prune_source(SOURCE, seen_ids)
+    return list(seen_ids), embedded
+
+
+def test_streamed_chunks_are_indexed_stored_or_not(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.json"))
+    ids, _ = _ingest(index, _docs("الإنارة العمومية", "جمع النفايات المنزلية"))
+    assert index.has_chunks(SOURCE, ids)
+
+    # New version of the file: one chunk kept (already stored), one replaced
+    ids, embedded = _ingest(index, _docs("الإنارة العمومية", "تدبير الماء الصالح للشرب"), stored=ids)
+    assert len(embedded) == 1
+    assert index.has_chunks(SOURCE, ids)
+    assert index.search("النفايات") == []
+    assert [doc.page_content for doc, _ in index.search("الإنارة")] == ["الإنارة العمومية"]
+
+    index.save()
+    reloaded = BM25Index(index.path)
+    assert reloaded.has_chunks(SOURCE, ids)
+    assert not reloaded.has_chunks(SOURCE, ids[:1])
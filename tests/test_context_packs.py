@@ -0,0 +1,70 @@
+import json
+import os
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from src.agents.rag_agent import RAGAgent
+from src.tools.context_packs import ContextPacks, corpus_fingerprint
+
+
+def _manifest(chunks):
+    return {"version": 1, "sources": {"data/raw/loi.pdf": {"sha256": "x", "chunking": "fixed", "sectors": 1,
+                                                           "chunks": chunks}}}
+
+
+def _write(path, data, bump=0):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    if bump:
+        # Coarse filesystem timestamps: make the change visible
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump))
+
+
+def _packs_file(path, manifest, bump=0):
+    docs = [{"text": "المادة 83", "metadata": {"chunk_id": "a"}}, {"text": "المادة 84", "metadata": {"chunk_id": "b"}}]
+    _write(path, {"version": 1, "fingerprint": corpus_fingerprint(manifest),
+                  "packs": {"lighting": {"query": "q", "docs": docs}}}, bump)
+
+
+def test_packs_follow_the_manifest_at_serve_time(tmp_path):
+    manifest_path, packs_path = str(tmp_path / "manifest.json"), str(tmp_path / "packs.json")
+    manifest = _manifest(["a", "b"])
+    _write(manifest_path, manifest)
+    _packs_file(packs_path, manifest)
+    packs = ContextPacks(packs_path, manifest_path)
+    assert [doc.metadata["chunk_id"] for doc in packs.get("lighting")] == ["a", "b"]
+
+    # The corpus changed after startup: the packs are stale
+    changed = _manifest(["a", "b", "c"])
+    _write(manifest_path, changed, bump=10 ** 9)
+    assert packs.get("lighting") == []
+    assert packs.chunk_ids("lighting") == set()
+
+    # Ingestion rebuilt them for the new corpus
+    _packs_file(packs_path, changed, bump=10 ** 9)
+    assert packs.chunk_ids("lighting") == {"a", "b"}
+
+
+def _agent(packs, hits):
+    lexical_index = None if hits is None else SimpleNamespace(search=lambda query, k: hits)
+    return SimpleNamespace(context_packs=packs, lexical_index=lexical_index, rerank=lambda query, docs: docs)
+
+
+def _hit(chunk_id):
+    return Document(page_content=chunk_id, metadata={"chunk_id": chunk_id}), 1.0
+
+
+def test_pack_needs_lexical_hits_all_inside_it(tmp_path):
+    manifest_path, packs_path = str(tmp_path / "manifest.json"), str(tmp_path / "packs.json")
+    manifest = _manifest(["a", "b", "c"])
+    _write(manifest_path, manifest)
+    _packs_file(packs_path, manifest)
+    packs = ContextPacks(packs_path, manifest_path)
+
+    assert len(RAGAgent.packed_context(_agent(packs, [_hit("a"), _hit("b")]), "إنارة", "البولة طافية")) == 2
+    assert RAGAgent.packed_context(_agent(packs, [_hit("a"), _hit("c")]), "إنارة", "البولة طافية") is None
+    # Nothing to check the pack against: a real search is done
+    assert RAGAgent.packed_context(_agent(packs, []), "إنارة", "البولة طافية") is None
+    assert RAGAgent.packed_context(_agent(packs, None), "إنارة", "البولة طافية") is None
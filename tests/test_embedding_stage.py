@@ -0,0 +1,93 @@
+import time
+import random
+
+import pytest
+from langchain_core.documents import Document
+from langchain_openai import OpenAIEmbeddings
+
+from src.ingestion import batched, _new_chunks
+from src.tools.embedding_stage import EmbeddingStage
+from src.tools.fake_embeddings_server import fake_vector
+from src.tools.rate_limit import TokenBucket
+
+SOURCE = "data/raw/test.pdf"
+
+
+def _embeddings(base_url):
+    return OpenAIEmbeddings(model="fake", openai_api_key="test", openai_api_base=base_url,
+                            max_retries=0, check_embedding_ctx_length=False, dimensions=8)
+
+
+def _docs(count):
+    return [Document(page_content=f"المادة {i}: نص تجريبي رقم {i}", metadata={"source": SOURCE}) for i in range(count)]
+
+
+def test_batches_are_embedded_once_each(embeddings_server):
+    base_url, handler = embeddings_server
+    stage = EmbeddingStage(_embeddings(base_url), batch_size=4, max_parallel=3)
+    pairs = [(str(i), doc) for i, doc in enumerate(_docs(10))]
+
+    results = list(stage.embed_batches(batched(pairs, 4)))
+
+    assert sorted(len(batch) for batch, _ in results) == [2, 4, 4]
+    assert handler.requests_served == 3
+    for batch, vectors in results:
+        # Every batch comes back with its own vectors, whatever the completion order
+        for (_, doc), vector in zip(batch, vectors):
+            assert list(vector) == pytest.approx(fake_vector(doc.page_content, 8))
+
+
+def test_failed_requests_are_retried(embeddings_server):
+    base_url, handler = embeddings_server
+    handler.fail_rate = 0.5
+    random.seed(3)
+    stage = EmbeddingStage(_embeddings(base_url), batch_size=2, max_parallel=1, max_retries=20, base_delay=0.01)
+    pairs = [(str(i), doc) for i, doc in enumerate(_docs(6))]
+
+    results = list(stage.embed_batches(batched(pairs, 2)))
+
+    assert len(results) == 3
+    assert stage.retries > 0
+    assert handler.requests_served == 3 + stage.retries
+
+
+def test_retries_give_up_after_max_retries(embeddings_server):
+    base_url, handler = embeddings_server
+    handler.fail_rate = 1.0
+    stage = EmbeddingStage(_embeddings(base_url), batch_size=2, max_parallel=1, max_retries=2, base_delay=0.01)
+
+    with pytest.raises(Exception):
+        list(stage.embed_batches(batched([("0", _docs(1)[0])], 2)))
+    assert handler.requests_served == 3
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # The first token is in the bucket, the next five wait 1/50 s each
+    assert time.monotonic() - start >= 0.09
+
+
+def test_interrupted_run_resumes_without_re_embedding(embeddings_server):
+    base_url, handler = embeddings_server
+    stage = EmbeddingStage(_embeddings(base_url), batch_size=3, max_parallel=1)
+
+    # First run: interrupted once the first batch is stored (checkpointed)
+    stored = []
+    for batch, _ in stage.embed_batches(batched(_new_chunks(SOURCE, _docs(9), set(), {}), 3)):
+        stored.extend(doc_id for doc_id, _ in batch)
+        break
+    assert len(stored) == 3
+    served = handler.requests_served
+
+    # Second run: the checkpointed chunks are skipped, the rest is embedded
+    seen_ids = {}
+    resumed = []
+    for batch, _ in stage.embed_batches(batched(_new_chunks(SOURCE, _docs(9), set(stored), seen_ids), 3)):
+        resumed.extend(doc_id for doc_id, _ in batch)
+
+    assert len(seen_ids) == 9
+    assert set(resumed) == set(seen_ids) - set(stored)
+    assert handler.requests_served - served == 2
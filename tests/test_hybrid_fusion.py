@@ -0,0 +1,29 @@
+from langchain_core.documents import Document
+
+from src.tools.retriever import fuse_scores
+
+
+def _doc(chunk_id):
+    return Document(page_content=chunk_id, metadata={"chunk_id": chunk_id})
+
+
+def _ids(docs):
+    return [doc.metadata["chunk_id"] for doc in docs]
+
+
+def test_single_lexical_hit_does_not_outrank_the_vector_top():
+    vector = [(_doc("a"), 0.9), (_doc("b"), 0.8), (_doc("c"), 0.7)]
+    # Min-max gave a lone BM25 hit a perfect 1.0 and the weakest vector hit a 0
+    lexical = [(_doc("z"), 0.4)]
+    assert _ids(fuse_scores(vector, lexical, k=4, alpha=0.6)) == ["a", "b", "c", "z"]
+
+
+def test_chunks_found_by_both_sides_come_first():
+    vector = [(_doc("a"), 0.9), (_doc("b"), 0.8)]
+    lexical = [(_doc("b"), 12.0), (_doc("c"), 3.0)]
+    assert _ids(fuse_scores(vector, lexical, k=3))[0] == "b"
+
+
+def test_constant_scores_keep_every_hit_and_duplicates_once():
+    vector = [(_doc("a"), 0.5), (_doc("a"), 0.7), (_doc("b"), 0.5)]
+    assert sorted(_ids(fuse_scores(vector, [], k=5))) == ["a", "b"]
@@ -0,0 +1,93 @@
+import pytest
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.agents.triage_agent import TriageAgent
+from src.tools import model_router
+from src.tools.model_router import LowConfidence, ModelRouter, ModelStats
+
+PROMPT = ChatPromptTemplate.from_messages([("human", "{complaint}")])
+
+
+def _router(base_url, tmp_path, policy):
+    return ModelRouter(policy=policy, prices={"cheap": (1.0, 1.0), "strong": (10.0, 10.0)},
+                       stats=ModelStats(str(tmp_path / "stats.sqlite")), base_url=base_url, api_key="test")
+
+
+def _chain_for(router, agent):
+    return lambda model: PROMPT | router.llm(agent, model, temperature=0, max_retries=0) | JsonOutputParser()
+
+
+def test_invalid_answer_escalates_to_the_stronger_model(chat_server, tmp_path):
+    base_url, handler = chat_server
+    handler.invalid_models = {"cheap"}
+    router = _router(base_url, tmp_path, {"triage": {"models": ["cheap"], "escalate": ["strong"]}})
+
+    result = router.run("triage", _chain_for(router, "triage"), {"complaint": "البولة طافية"}, TriageAgent._validated)
+
+    assert result["category"] == "إنارة"
+    assert router.stats.summary("triage", "cheap")["error_rate"] > 0
+    assert router.stats.summary("triage", "strong")["calls"] == 1
+
+
+def test_invalid_answer_on_the_last_model_raises(chat_server, tmp_path):
+    base_url, handler = chat_server
+    handler.invalid_models = {"cheap", "strong"}
+    router = _router(base_url, tmp_path, {"triage": {"models": ["cheap"], "escalate": ["strong"]}})
+
+    with pytest.raises(ValueError):
+        router.run("triage", _chain_for(router, "triage"), {"complaint": "البولة طافية"})
+
+
+def test_low_confidence_keeps_the_last_answer(chat_server, tmp_path):
+    base_url, _ = chat_server
+    router = _router(base_url, tmp_path, {"triage": {"models": ["cheap"], "escalate": ["strong"]}})
+    tried = []
+
+    def doubtful(result):
+        tried.append(result)
+        raise LowConfidence("doubtful", result)
+
+    result = router.run("triage", _chain_for(router, "triage"), {"complaint": "البولة طافية"}, doubtful)
+
+    assert len(tried) == 2
+    assert result["category"] == "إنارة"
+
+
+def test_slow_model_is_replaced_once_measured(chat_server, tmp_path, monkeypatch):
+    base_url, handler = chat_server
+    handler.latencies = {"strong": 0.3}
+    monkeypatch.setattr(model_router, "MIN_SAMPLES", 3)
+    router = _router(base_url, tmp_path, {"rag": {"models": ["strong", "cheap"], "max_p95_s": 0.1}})
+    chain_for = _chain_for(router, "rag")
+
+    # Unmeasured: the first choice is trusted until it has MIN_SAMPLES calls
+    for _ in range(3):
+        assert router.select("rag") == "strong"
+        router.run("rag", chain_for, {"complaint": "البولة طافية"})
+
+    assert router.stats.summary("rag", "strong")["p95_s"] >= 0.3
+    assert router.select("rag") == "cheap"
+
+
+def test_streamed_calls_record_their_tokens(chat_server, tmp_path):
+    base_url, _ = chat_server
+    router = _router(base_url, tmp_path, {"triage": {"models": ["cheap"]}})
+
+    chunks = list(_chain_for(router, "triage")("cheap").stream({"complaint": "البولة طافية"}))
+
+    assert chunks[-1]["category"] == "إنارة"
+    summary = router.stats.summary("triage", "cheap")
+    assert summary["calls"] == 1
+    assert summary["input_tokens"] > 0 and summary["output_tokens"] > 0
+
+
+@pytest.mark.parametrize("category", ["إنارة", "ماء", "Eau", "water", "أخرى", "Autre", "other"])
+def test_known_categories_are_trusted(category):
+    analysis = {"category": category, "summary_ar": "ملخص", "urgency": "low"}
+    assert TriageAgent._validated(analysis)["category"] == category
+
+
+def test_unknown_category_is_low_confidence():
+    with pytest.raises(LowConfidence):
+        TriageAgent._validated({"category": "سياحة", "summary_ar": "ملخص", "urgency": "Low"})
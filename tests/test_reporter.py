@@ -0,0 +1,50 @@
+import re
+
+import pytest
+
+from src.agents.reporter import render_report
+from src.tools.legal_opinion import legal_opinion
+
+ADVICE = """1. المادة 83 من القانون التنظيمي 113.14.
+2. نوع الاختصاص: اختصاص ذاتي للجماعة.
+3. مقترح للإجراء: إصلاح أعمدة الإنارة في أقرب الآجال."""
+
+ARABIC = re.compile(r"[؀-ۿ]")
+
+
+@pytest.mark.parametrize("category", ["إنارة", "ماء", "أخرى", "سياحة"])
+def test_template_report_is_french_only(category):
+    report = render_report({"category": category, "summary_ar": "ملخص بالعربية", "urgency": "High"}, ADVICE)
+    assert not ARABIC.search(report)
+    # The PDF export is latin-1: only the heading emoji is lost
+    assert report.encode("latin-1", "replace").decode("latin-1").count("?") == 1
+
+
+def test_template_report_uses_cited_articles_and_competence():
+    report = render_report({"category": "إنارة", "urgency": "Medium"}, ADVICE)
+    assert "article 83" in report
+    assert "compétence propre" in report
+    assert "Service de l'Éclairage Public" in report
+
+
+def test_uncited_article_is_left_to_the_legal_service():
+    assert legal_opinion("الجماعة مسؤولة عن الإنارة.")["articles"] == []
+    report = render_report({"category": "ماء", "urgency": "Low"}, "الجماعة مسؤولة عن الماء.")
+    assert "article à confirmer" in report
+
+
+@pytest.mark.parametrize("advice", [
+    "2. هل هذا الاختصاص ذاتي للجماعة أم مشترك؟ الجواب: مشترك مع الدولة.",
+    "2. نوع الاختصاص (ذاتي/مشترك): مشترك",
+    "2. هذا الاختصاص ليس ذاتياً بل مشترك.",
+])
+def test_ambiguous_competence_is_left_to_the_legal_service(advice):
+    assert legal_opinion(advice)["competence"] is None
+    report = render_report({"category": "إنارة", "urgency": "Low"}, advice)
+    assert "type de compétence à confirmer" in report
+    assert "compétence propre" not in report
+
+
+def test_law_number_is_not_an_article():
+    assert legal_opinion("حسب المادة 113.14 و المادة 83")["articles"] == [83]
+    assert legal_opinion("المادتين 83 و 84")["articles"] == [83, 84]
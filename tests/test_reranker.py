@@ -0,0 +1,34 @@
+from langchain_core.documents import Document
+
+from src.tools.reranker import LocalReranker
+
+FILLER = " تمارس الجماعة هذه الاختصاصات طبقا للقوانين والأنظمة الجاري بها العمل داخل نفوذها الترابي."
+
+
+def _doc(text):
+    return Document(page_content=text + FILLER * 2)
+
+
+CANDIDATES = [
+    _doc("المادة 83: تقوم الجماعة بإحداث وتدبير المرافق والتجهيزات العمومية اللازمة لتقديم خدمات القرب في ميدان الإنارة العمومية."),
+    _doc("المادة 87: تحدث الجماعة مرفق توزيع الكهرباء وتسهر على صيانة شبكة الإنارة في الأحياء."),
+    _doc("المادة 92: يتداول مجلس الجماعة في برنامج عمل الجماعة وفي الميزانية."),
+    _doc("المادة 10: تنتخب مجالس الجماعات بالاقتراع العام المباشر."),
+    _doc("المادة 94: يمارس رئيس مجلس الجماعة صلاحيات الشرطة الإدارية في ميادين الوقاية الصحية والنظافة."),
+]
+
+
+def test_several_relevant_chunks_survive_a_normal_query():
+    kept = LocalReranker().rerank("إنارة انطفاء الإنارة العمومية في الحي", CANDIDATES, top_n=3)
+    assert len(kept) > 1
+    assert kept[0] is CANDIDATES[0]
+
+
+def test_unrelated_chunks_are_dropped():
+    kept = LocalReranker().rerank("الإنارة العمومية", CANDIDATES, top_n=5)
+    assert CANDIDATES[3] not in kept
+
+
+def test_best_chunk_is_kept_without_any_overlap():
+    kept = LocalReranker().rerank("سياحة", CANDIDATES, top_n=3)
+    assert kept[0] is CANDIDATES[0]
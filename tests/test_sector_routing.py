@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from src.agents.rag_agent import RAGAgent
+from src.ingestion import _new_chunks
+from src.tools.retriever import DEFAULT_K
+from src.tools.sectors import manifest_sector_counts
+
+SOURCE = "data/raw/loi.pdf"
+
+
+def test_new_chunks_record_the_sectors_of_every_chunk():
+    docs = [Document(page_content=text, metadata={}) for text in
+            ("الإنارة العمومية و الطرق", "الإنارة العمومية و الطرق", "تدبير الماء الصالح للشرب", "أحكام عامة")]
+    seen_ids = {}
+    list(_new_chunks(SOURCE, docs, set(), seen_ids))
+    # The duplicate chunk is counted once
+    assert sorted(seen_ids.values()) == ["lighting,roads", "other", "water"]
+
+
+def test_manifest_sector_counts_sum_every_source():
+    manifest = {"sources": {"a.pdf": {"sector_counts": {"water": 2, "other": 5}},
+                            "b.pdf": {"sector_counts": {"water": 1}},
+                            "old.pdf": {}}}
+    assert manifest_sector_counts(manifest) == {"water": 3, "other": 5}
+
+
+def _agent(counts):
+    return SimpleNamespace(sector_counts=counts, _sector_retrievers={}, candidates=SimpleNamespace())
+
+
+def test_small_partitions_are_not_searched(monkeypatch):
+    monkeypatch.setattr("src.agents.rag_agent.with_filter", lambda retriever, filter, min_relevance: ("filtered", filter))
+    assert RAGAgent.sector_retriever(_agent({"other": 500}), "ماء") is None
+    assert RAGAgent.sector_retriever(_agent({"water": DEFAULT_K - 1}), "ماء") is None
+    assert RAGAgent.sector_retriever(_agent({"water": DEFAULT_K}), "ماء") == ("filtered", {"sector_water": True})
@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from src.tools.triage_classifier import (
+    HEADS, TriageClassifier, append_triage_log, evaluate, features, read_triage_log, split_holdout,
+    training_problems, _targets,
+)
+
+TEMPLATES = {
+    ("إنارة", "Medium"): ["البولة طافية ف {place}", "الضو مقطوع ف {place} من البارح", "ما كاينش الضو ف {place}"],
+    ("نظافة", "High"): ["الزبل مجموع ف {place} و الريحة خايبة", "الأزبال ما تجمعاتش ف {place}",
+                        "حاويات الزبل عامرين ف {place}"],
+}
+PLACES = ["الحومة", "الزنقة 12", "حي السلام", "الدرب", "قرب المدرسة", "السوق", "حي النهضة", "باب الدار"]
+
+
+def _examples():
+    return [(template.format(place=place), {"category": category, "summary_ar": "ملخص", "urgency": urgency})
+            for (category, urgency), templates in TEMPLATES.items()
+            for template in templates for place in PLACES]
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    examples = _examples()
+    return TriageClassifier.train([text for text, _ in examples], _targets(examples), epochs=40, threshold=0.6)
+
+
+def test_features_are_normalized_and_spelling_tolerant():
+    indices, values = features("البولة طافية")
+    assert len(indices) == len(values) > 0
+    assert np.linalg.norm(values) == pytest.approx(1.0, abs=1e-5)
+    # Normalized text: hamza/taa marbuta variants give the same features
+    assert set(features("البوله طافيه")[0]) == set(indices)
+
+
+def test_analyze_answers_confident_complaints_locally(classifier):
+    analysis = classifier.analyze("البولة طافية ف حي الفتح")
+    assert analysis["category"] == "إنارة"
+    assert analysis["urgency"] == "Medium"
+    assert analysis["source"] == "local"
+    assert analysis["confidence"] >= 0.6
+    assert classifier.predict("الزبل مجموع ف حي الفتح")["category"][0] == "نظافة"
+
+
+def test_analyze_defers_to_the_llm_below_threshold(classifier):
+    strict = TriageClassifier(classifier.heads, threshold=0.999999)
+    assert strict.analyze("البولة طافية ف حي الفتح") is None
+
+
+def test_save_and_load_round_trip(classifier, tmp_path):
+    path = str(tmp_path / "model.npz")
+    classifier.save(path)
+    loaded = TriageClassifier.load(path, threshold=classifier.threshold)
+    text = "الضو مقطوع ف الحومة"
+    for head in HEADS:
+        assert loaded.predict(text)[head][0] == classifier.predict(text)[head][0]
+
+
+def test_log_round_trip_skips_incomplete_analyses(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    append_triage_log("البولة طافية", {"category": "إنارة", "urgency": "Medium"}, path)
+    append_triage_log("شكاية", {"category": "إنارة"}, path)
+    assert read_triage_log(path) == [("البولة طافية", {"category": "إنارة", "urgency": "Medium"})]
+
+
+def test_training_problems(classifier):
+    examples = _examples()
+    train_set, test_set = split_holdout(examples, 0.3)
+    assert train_set and test_set
+    report = evaluate(classifier, test_set)
+    assert training_problems(train_set, report, min_examples=10, min_accuracy=0.9) == []
+
+    problems = training_problems(train_set, report, min_examples=1000, min_accuracy=0.9)
+    assert len(problems) == 1 and "1000" in problems[0]
+    single_class = [(text, dict(analysis, urgency="Low")) for text, analysis in train_set]
+    assert any("urgency" in problem for problem in training_problems(single_class, report, 10, 0.9))
+    assert training_problems(train_set, {}, 10, 0.9)
+    assert training_problems(train_set, dict(report, local_accuracy=0.5), 10, 0.9)
+
+
+def test_train_command_refuses_to_save_a_weak_model(tmp_path):
+    log_path, model_path = tmp_path / "log.jsonl", tmp_path / "model.npz"
+    with open(log_path, "w", encoding="utf-8") as f:
+        for text, analysis in _examples()[:5]:
+            f.write(json.dumps({"complaint": text, "analysis": analysis}, ensure_ascii=False) + "\n")
+    result = subprocess.run([sys.executable, "-m", "src.tools.triage_classifier", "train", "--log", str(log_path),
+                             "--model", str(model_path), "--epochs", "2"], capture_output=True, text=True)
+    assert result.returncode == 1
+    assert not model_path.exists()
+
+
+def test_log_is_rotated_past_its_size_cap(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    for i in range(12):
+        append_triage_log(f"شكاية {i}", {"category": "إنارة", "urgency": "Low"}, path, max_bytes=200)
+    # One backup at most: the oldest lines are dropped, the rest are still training data
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["log.jsonl", "log.jsonl.1"]
+    assert os.path.getsize(path) < 400
+    texts = [text for text, _ in read_triage_log(path)]
+    assert texts[-1] == "شكاية 11" and 2 <= len(texts) < 12
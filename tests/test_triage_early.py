@@ -0,0 +1,52 @@
+import asyncio
+
+from src.agents.triage_agent import TriageAgent
+from src.tools.model_router import ModelRouter, ModelStats
+
+
+def _agent(base_url, tmp_path):
+    router = ModelRouter(policy={"triage": {"models": ["cheap"], "escalate": ["strong"]}}, prices={},
+                         stats=ModelStats(str(tmp_path / "stats.sqlite")), base_url=base_url, api_key="test")
+    agent = TriageAgent(router=router, log_path=None)
+    agent.llm_cache = None
+    return agent
+
+
+def test_streamed_triage_escalates_an_invalid_answer(chat_server, tmp_path):
+    base_url, handler = chat_server
+    handler.invalid_models = {"cheap"}
+    agent = _agent(base_url, tmp_path)
+    ready = []
+
+    analysis = agent.analyze_complaint_early("البولة طافية", ready.append)
+
+    assert analysis["category"] == "إنارة"
+    # The RAG agent is started once, on the escalated answer
+    assert [partial["category"] for partial in ready] == ["إنارة"]
+    assert agent.router.stats.summary("triage", "cheap")["error_rate"] > 0
+    assert agent.router.stats.summary("triage", "strong")["calls"] == 1
+
+
+def test_streamed_triage_keeps_a_valid_answer(chat_server, tmp_path):
+    base_url, _ = chat_server
+    agent = _agent(base_url, tmp_path)
+    ready = []
+
+    analysis = agent.analyze_complaint_early("البولة طافية", ready.append)
+
+    assert analysis["urgency"] == "Medium"
+    assert len(ready) == 1
+    assert agent.router.stats.summary("triage", "strong")["calls"] == 0
+
+
+def test_async_streamed_triage_escalates_an_invalid_answer(chat_server, tmp_path):
+    base_url, handler = chat_server
+    handler.invalid_models = {"cheap"}
+    agent = _agent(base_url, tmp_path)
+    ready = []
+
+    analysis = asyncio.run(agent.aanalyze_complaint_early("البولة طافية", ready.append))
+
+    assert analysis["category"] == "إنارة"
+    assert len(ready) == 1
+    assert agent.router.stats.summary("triage", "strong")["calls"] == 1